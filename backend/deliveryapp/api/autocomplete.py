@@ -0,0 +1,202 @@
+"""
+Подсказки при вводе номеров транспорта и ФИО сборщиков.
+
+Для каждого поля в процессе хранится отсортированный массив различных
+значений: поиск по префиксу — это два ``bisect`` и выбор лучших по
+частоте использования. Индекс строится в фоне, дополняется при
+сохранении и периодически перестраивается; пока он не готов, ответ
+берётся запросом ``UPPER(field) LIKE 'PREFIX%'`` по функциональному
+индексу БД.
+
+Поиск в обоих случаях не зависит от регистра: варианты написания
+объединяются, и показывается самый часто используемый из них.
+"""
+import bisect
+import heapq
+import threading
+import time
+from datetime import timedelta
+
+from django.db import connections
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from api.models import TransportModel
+from delivery.models import Delivery
+
+# Использования за последние RECENT_DAYS дней весят RECENT_WEIGHT раз больше
+RECENT_DAYS = 30
+RECENT_WEIGHT = 10
+REFRESH_INTERVAL = 15 * 60
+DEFAULT_LIMIT = 10
+
+
+def usage_weight(updated_at=None):
+    """Вес одной доставки с учётом давности её изменения."""
+    since = timezone.now() - timedelta(days=RECENT_DAYS)
+    recent = updated_at is None or updated_at >= since
+    return 1 + RECENT_WEIGHT if recent else 1
+
+
+def merge_variants(rows):
+    """
+    Объединяет варианты написания значения без учёта регистра:
+    ``{ключ: [самый частый вариант, суммарный вес]}``.
+    """
+    variants = {}
+    for value, score in rows:
+        if not value:
+            continue
+        scores = variants.setdefault(value.casefold(), {})
+        scores[value] = scores.get(value, 0) + score
+    return {
+        key: [
+            min(scores, key=lambda value: (-scores[value], value)),
+            sum(scores.values()),
+        ]
+        for key, scores in variants.items()
+    }
+
+
+def _rank(row):
+    return (-row[1], row[0])
+
+
+class AutocompleteSource:
+    """Поле модели и путь к доставкам, по которым считается частота."""
+
+    def __init__(self, model, field, usage):
+        self.model = model
+        self.field = field
+        self.usage = usage
+
+    def _annotated(self, queryset):
+        since = timezone.now() - timedelta(days=RECENT_DAYS)
+        recent = Q(**{f"{self.usage}updated_at__gte": since})
+        return (
+            queryset.values_list(self.field)
+            .annotate(
+                total=Count(f"{self.usage}pk"),
+                recent=Count(f"{self.usage}pk", filter=recent),
+            )
+            .order_by()
+        )
+
+    def load(self):
+        for value, total, recent in self._annotated(
+            self.model.objects.all()
+        ).iterator():
+            yield value, total + recent * RECENT_WEIGHT
+
+    def query(self, prefix, limit):
+        rows = self._annotated(
+            self.model.objects.filter(
+                **{f"{self.field}__istartswith": prefix}
+            )
+        )
+        entries = merge_variants(
+            (value, total + recent * RECENT_WEIGHT)
+            for value, total, recent in rows
+        )
+        return heapq.nsmallest(
+            limit, map(tuple, entries.values()), key=_rank
+        )
+
+
+class PrefixIndex:
+    def __init__(
+        self, source, refresh_interval=REFRESH_INTERVAL, keep_unused=False
+    ):
+        self.source = source
+        self.refresh_interval = refresh_interval
+        # Оставлять ли значения, которые больше нигде не используются
+        # (справочник хранит их и без доставок)
+        self.keep_unused = keep_unused
+        self._lock = threading.Lock()
+        self._keys = []
+        self._entries = {}
+        self._built_at = None
+        self._building = False
+
+    def _build(self):
+        try:
+            entries = merge_variants(self.source.load())
+            keys = sorted(entries)
+            with self._lock:
+                self._keys, self._entries = keys, entries
+                self._built_at = time.monotonic()
+        finally:
+            with self._lock:
+                self._building = False
+            connections.close_all()
+
+    def is_ready(self):
+        """Готов ли индекс; при необходимости запускает перестроение."""
+        with self._lock:
+            ready = self._built_at is not None
+            stale = (
+                not ready
+                or time.monotonic() - self._built_at > self.refresh_interval
+            )
+            if not stale or self._building:
+                return ready
+            self._building = True
+        threading.Thread(target=self._build, daemon=True).start()
+        return ready
+
+    def touch(self, value, weight=RECENT_WEIGHT + 1):
+        """
+        Учитывает новое использование значения. Отрицательный вес
+        снимает прежнее; значение без использований удаляется, если
+        индекс не ``keep_unused``.
+        """
+        if not value:
+            return
+        key = value.casefold()
+        with self._lock:
+            if self._built_at is None:
+                return
+            entry = self._entries.get(key)
+            if entry is None:
+                if weight < 0:
+                    return
+                self._entries[key] = [value, weight]
+                bisect.insort(self._keys, key)
+                return
+            entry[1] += weight
+            if entry[1] > 0:
+                return
+            if self.keep_unused:
+                entry[1] = 0
+            else:
+                del self._entries[key]
+                del self._keys[bisect.bisect_left(self._keys, key)]
+
+    def invalidate(self):
+        """Значения удалены или переименованы: нужен полный пересчёт."""
+        with self._lock:
+            self._built_at = None
+
+    def search(self, prefix, limit=DEFAULT_LIMIT):
+        if not self.is_ready():
+            return self.source.query(prefix, limit)
+        key = prefix.casefold()
+        with self._lock:
+            low = bisect.bisect_left(self._keys, key)
+            high = bisect.bisect_left(self._keys, key + "\U0010ffff", low)
+            matches = [
+                tuple(self._entries[match]) for match in self._keys[low:high]
+            ]
+        return heapq.nsmallest(limit, matches, key=_rank)
+
+
+INDEXES = {
+    "transport_number": PrefixIndex(
+        AutocompleteSource(Delivery, "transport_number", "")
+    ),
+    "collector": PrefixIndex(AutocompleteSource(Delivery, "collector", "")),
+    "transport_model": PrefixIndex(
+        AutocompleteSource(TransportModel, "number", "deliveries__"),
+        keep_unused=True,
+    ),
+}
@@ -0,0 +1,125 @@
+"""
+Кэш ответов GET-запросов ViewSet'ов с версионной инвалидацией.
+
+Ключ ответа включает счётчики поколений всех моделей, от которых зависят
+данные. При сохранении, удалении или массовом изменении объектов
+счётчик их модели увеличивается, и старые ответы просто перестают
+находиться по ключу — перебирать ключи кэша не нужно.
+"""
+import hashlib
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.response import Response
+
+GENERATION_KEY = "response-cache:generation:{}"
+
+_stats_lock = threading.Lock()
+_stats = Counter()
+
+
+def _generation_key(model):
+    return GENERATION_KEY.format(model._meta.label_lower)
+
+
+def bump_generation(model):
+    """Инвалидирует все закэшированные ответы, зависящие от модели."""
+    key = _generation_key(model)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Счётчик вытеснен из кэша: начинаем с метки времени, чтобы не
+        # совпасть с поколениями уже сохранённых ответов
+        cache.set(key, time.time_ns(), timeout=None)
+
+
+def get_generations(models):
+    keys = [_generation_key(model) for model in models]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            cache.add(key, time.time_ns(), timeout=None)
+            generations[key] = cache.get(key)
+    return [generations[key] for key in keys]
+
+
+def record(view_name, hit):
+    with _stats_lock:
+        _stats["hits" if hit else "misses"] += 1
+        _stats[f"{view_name}:{'hits' if hit else 'misses'}"] += 1
+
+
+def get_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    hits = stats.pop("hits", 0)
+    misses = stats.pop("misses", 0)
+    views = {}
+    for key, value in stats.items():
+        view_name, kind = key.rsplit(":", 1)
+        views.setdefault(view_name, {"hits": 0, "misses": 0})[kind] = value
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": hits / total if total else None,
+        "views": views,
+    }
+
+
+class CachedResponseMixin:
+    """
+    Кэширует ``list`` и ``retrieve``. Ключ строится из нормализованных
+    параметров запроса, пользователя (если ``cache_per_user``) и поколений
+    ``cache_dependencies`` (по умолчанию — модель ``queryset``).
+    """
+
+    cache_dependencies = ()
+    cache_per_user = True
+
+    def get_cache_dependencies(self):
+        return self.cache_dependencies or (self.queryset.model,)
+
+    def get_cache_key(self, request, **kwargs):
+        query = sorted(
+            (name, sorted(value for value in values if value != ""))
+            for name, values in request.query_params.lists()
+            if any(values)
+        )
+        user = "any"
+        if self.cache_per_user:
+            user = (
+                request.user.pk if request.user.is_authenticated else "anon"
+            )
+        raw = repr((query, sorted(kwargs.items()), user))
+        generations = get_generations(self.get_cache_dependencies())
+        return "response-cache:{}:{}:{}:{}".format(
+            self.basename,
+            self.action,
+            ".".join(str(generation) for generation in generations),
+            hashlib.md5(raw.encode()).hexdigest(),
+        )
+
+    def _cached(self, handler, request, *args, **kwargs):
+        view_name = f"{self.basename}-{self.action}"
+        key = self.get_cache_key(request, **kwargs)
+        data = cache.get(key)
+        if data is not None:
+            record(view_name, hit=True)
+            return Response(data, headers={"X-Cache": "HIT"})
+
+        record(view_name, hit=False)
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, settings.RESPONSE_CACHE_TIMEOUT)
+        response["X-Cache"] = "MISS"
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self._cached(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._cached(super().retrieve, request, *args, **kwargs)
@@ -0,0 +1,129 @@
+"""
+Отдача вложений после проверки прав.
+
+За nginx передача файла делегируется ему через ``X-Accel-Redirect``:
+воркер gunicorn освобождается сразу, а Range и ETag обрабатывает nginx.
+Без прокси файл отдаётся самим Django частями, с поддержкой одного
+диапазона байтов и условных запросов по ETag.
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import parse_etags
+from django.utils.http import content_disposition_header
+
+# Заголовок, которым nginx сообщает о поддержке X-Accel-Redirect
+ACCEL_HEADER = "HTTP_X_SENDFILE_TYPE"
+ACCEL_REDIRECT = "X-Accel-Redirect"
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+CHUNK_SIZE = 64 * 1024
+
+
+def file_etag(stat):
+    """Сильный ETag в формате nginx: время изменения и размер."""
+    return f'"{int(stat.st_mtime):x}-{stat.st_size:x}"'
+
+
+def _etag_matches(header, etag):
+    """
+    Слабое сравнение для ``If-None-Match``: список ETag через запятую
+    (в том числе с префиксом ``W/``) или ``*``.
+    """
+    etags = parse_etags(header)
+    return "*" in etags or etag.removeprefix("W/") in {
+        value.removeprefix("W/") for value in etags
+    }
+
+
+def _parse_range(header, size):
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        # Несколько диапазонов и нераспознанные форматы отдаём целиком
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        if int(end) == 0 or size == 0:
+            return False
+        return max(size - int(end), 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def _iter_range(file, start, length):
+    file.seek(start)
+    remaining = length
+    try:
+        while remaining > 0:
+            chunk = file.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
+
+
+def attachment_response(request, field_file):
+    path = field_file.path
+    stat = os.stat(path)
+    etag = file_etag(stat)
+    filename = os.path.basename(field_file.name)
+    content_type = (
+        mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    )
+
+    if request.META.get(ACCEL_HEADER) == ACCEL_REDIRECT:
+        response = HttpResponse()
+        response[ACCEL_REDIRECT] = settings.ACCEL_REDIRECT_PREFIX + quote(
+            field_file.name
+        )
+        response["Content-Type"] = content_type
+        response["Content-Disposition"] = content_disposition_header(
+            True, filename
+        )
+        return response
+
+    if _etag_matches(request.headers.get("If-None-Match", ""), etag):
+        response = HttpResponse(status=304)
+        response["ETag"] = etag
+        return response
+
+    byte_range = None
+    range_header = request.headers.get("Range")
+    if range_header and request.headers.get("If-Range", etag) == etag:
+        byte_range = _parse_range(range_header, stat.st_size)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{stat.st_size}"
+        return response
+
+    file = open(path, "rb")
+    if byte_range is None:
+        response = FileResponse(file, as_attachment=True, filename=filename)
+        response.block_size = CHUNK_SIZE
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        response = StreamingHttpResponse(
+            _iter_range(file, start, length),
+            status=206,
+            content_type=content_type,
+        )
+        response["Content-Length"] = length
+        response["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+        response["Content-Disposition"] = content_disposition_header(
+            True, filename
+        )
+    response["Accept-Ranges"] = "bytes"
+    response["ETag"] = etag
+    return response
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.1 on 2026-10-19 16:32
+
+import api.models
+import django.db.models.functions.text
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transportmodel',
+            index=api.models.PatternOpsIndex(django.db.models.functions.text.Upper('number'), name='transport_model_number_ci'),
+        ),
+    ]
@@ -1,11 +1,62 @@
+from django.contrib.postgres.indexes import OpClass
 from django.db import models
+from django.db.models.functions import Upper
+from django.dispatch import Signal
 
 from api.constants import BASE_NAME_LENGTH
 
 
+class PatternOpsIndex(models.Index):
+    """
+    Индекс по выражению для поиска по префиксу (``LIKE 'PREFIX%'``).
+    В PostgreSQL строится с классом операторов ``text_pattern_ops``,
+    иначе при локали, отличной от C, он не используется для LIKE.
+    """
+
+    def create_sql(self, model, schema_editor, using="", **kwargs):
+        if schema_editor.connection.vendor != "postgresql":
+            return super().create_sql(model, schema_editor, using, **kwargs)
+        index = models.Index(
+            *(
+                OpClass(expression, name="text_pattern_ops")
+                for expression in self.expressions
+            ),
+            name=self.name,
+        )
+        return index.create_sql(model, schema_editor, using, **kwargs)
+
+
+# Отправляется после массовых изменений, для которых сигналы моделей
+# не вызываются. Аргументы: ``fields`` — изменённые поля (``None`` для
+# новых записей), ``using``; для доставок также ``days`` — затронутые
+# дни доставки.
+bulk_changed = Signal()
+
+
+class ReferenceQuerySet(models.QuerySet):
+    """
+    Массовые операции справочников, отправляющие ``bulk_changed``.
+    ``bulk_update`` выполняется через ``update``.
+    """
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        bulk_changed.send(sender=self.model, fields=None, using=self.db)
+        return objs
+
+    def update(self, **kwargs):
+        rows = super().update(**kwargs)
+        bulk_changed.send(
+            sender=self.model, fields=set(kwargs), using=self.db
+        )
+        return rows
+
+
 class ReferenceBase(models.Model):
     name = models.CharField("Название", max_length=BASE_NAME_LENGTH)
 
+    objects = ReferenceQuerySet.as_manager()
+
     class Meta:
         abstract = True
 
@@ -40,5 +91,13 @@ class DeliveryStatus(ReferenceBase):
 class TransportModel(models.Model):
     number = models.CharField("Номер транспорта", max_length=BASE_NAME_LENGTH)
 
+    objects = ReferenceQuerySet.as_manager()
+
+    class Meta:
+        # Для запросов UPPER(number) LIKE 'PREFIX%' (istartswith)
+        indexes = [
+            PatternOpsIndex(Upper("number"), name="transport_model_number_ci"),
+        ]
+
     def __str__(self):
         return self.number
@@ -1,6 +1,12 @@
+from django.db import models
+from django.urls import reverse
 from rest_framework import serializers
 
-from delivery.models import Delivery
+from api.constants import BASE_NAME_LENGTH
+
+from api.autocomplete import DEFAULT_LIMIT, INDEXES
+from delivery.events import FIELD_NAMES
+from delivery.models import Delivery, DeliveryEvent, TransitTimeSketch
 from api.models import (
     TechStatus,
     PackagingType,
@@ -40,13 +46,36 @@ class TransportModelSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
+class AttachmentField(serializers.FileField):
+    """
+    Вложение доставки. Вместо ссылки на ``/media/`` (nginx её не отдаёт)
+    возвращает адрес действия ``attachment``, проверяющего права.
+    """
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        url = reverse("deliveries-attachment", args=[value.instance.pk])
+        request = self.context.get("request")
+        return request.build_absolute_uri(url) if request else url
+
+
+DELIVERY_FIELD_MAPPING = {
+    **serializers.ModelSerializer.serializer_field_mapping,
+    models.FileField: AttachmentField,
+}
+
+
 class DeliveryWriteSerializer(serializers.ModelSerializer):
+    serializer_field_mapping = DELIVERY_FIELD_MAPPING
+
     class Meta:
         model = Delivery
         fields = "__all__"
 
 
 class DeliveryReadSerializer(serializers.ModelSerializer):
+    serializer_field_mapping = DELIVERY_FIELD_MAPPING
     transport_model = TransportModelSerializer(read_only=True)
     service = ServiceSerializer(read_only=True)
     packaging = PackagingTypeSerializer(read_only=True)
@@ -56,3 +85,41 @@ class DeliveryReadSerializer(serializers.ModelSerializer):
     class Meta:
         model = Delivery
         fields = "__all__"
+
+
+class TransitTimeQuerySerializer(serializers.Serializer):
+    start_date = serializers.DateField(required=False)
+    end_date = serializers.DateField(required=False)
+    dimension = serializers.ChoiceField(
+        choices=TransitTimeSketch.DIMENSION_CHOICES,
+        default=TransitTimeSketch.DIMENSION_ALL,
+    )
+    quantiles = serializers.ListField(
+        child=serializers.FloatField(min_value=0, max_value=1),
+        default=[0.5, 0.9, 0.99],
+    )
+
+
+class DeliveryEventSerializer(serializers.ModelSerializer):
+    field = serializers.CharField(source="get_field_display")
+
+    class Meta:
+        model = DeliveryEvent
+        fields = ("id", "field", "value", "created_at")
+
+
+class DwellTimeQuerySerializer(serializers.Serializer):
+    start = serializers.DateTimeField(required=False)
+    end = serializers.DateTimeField(required=False)
+    field = serializers.ChoiceField(
+        choices=tuple(FIELD_NAMES),
+        default="status",
+    )
+
+
+class AutocompleteQuerySerializer(serializers.Serializer):
+    field = serializers.ChoiceField(choices=tuple(INDEXES))
+    q = serializers.CharField(max_length=BASE_NAME_LENGTH)
+    limit = serializers.IntegerField(
+        min_value=1, max_value=50, default=DEFAULT_LIMIT
+    )
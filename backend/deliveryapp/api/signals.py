@@ -0,0 +1,202 @@
+import json
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.utils.encoders import JSONEncoder
+
+from api.autocomplete import INDEXES, usage_weight
+from api.cache import bump_generation
+from api.models import (
+    bulk_changed,
+    TechStatus,
+    PackagingType,
+    Service,
+    DeliveryStatus,
+    TransportModel,
+)
+from api.serializers import (
+    DeliveryReadSerializer,
+    TechStatusSerializer,
+    PackagingTypeSerializer,
+    ServiceSerializer,
+    DeliveryStatusSerializer,
+    TransportModelSerializer,
+)
+from api.streaming import (
+    broadcaster,
+    delivery_attrs,
+    previous_delivery_attrs,
+)
+from delivery.models import Delivery
+
+MODEL_SERIALIZERS = {
+    Delivery: DeliveryReadSerializer,
+    TechStatus: TechStatusSerializer,
+    PackagingType: PackagingTypeSerializer,
+    Service: ServiceSerializer,
+    DeliveryStatus: DeliveryStatusSerializer,
+    TransportModel: TransportModelSerializer,
+}
+
+
+# Поля доставки, значения которых попадают в подсказки
+AUTOCOMPLETE_FIELDS = {
+    "transport_number": "transport_number",
+    "collector": "collector",
+    "transport_model": "transport_model_id",
+}
+
+
+def _publish(instance, action, pk, attrs=None):
+    model = type(instance)
+    payload = {"id": pk}
+    if action != "deleted":
+        payload = MODEL_SERIALIZERS[model](instance).data
+    broadcaster.publish(
+        f"{model._meta.model_name}.{action}",
+        json.dumps(payload, cls=JSONEncoder, ensure_ascii=False),
+        attrs,
+    )
+
+
+@receiver(post_save)
+def stream_saved(sender, instance, created, raw, **kwargs):
+    if raw or sender not in MODEL_SERIALIZERS:
+        return
+    action = "created" if created else "updated"
+    attrs = previous = None
+    if sender is Delivery:
+        attrs = delivery_attrs(instance)
+        values = getattr(instance, "_previous_values", None)
+        if not created and values is not None:
+            previous = previous_delivery_attrs(values)
+            if previous == attrs:
+                previous = None
+
+    def publish():
+        _publish(instance, action, instance.pk, attrs)
+        if previous is not None:
+            # Доставка вышла из выборки подписчиков, подходивших только
+            # под прежние услугу или день: для них она удалена
+            _publish(
+                instance,
+                "deleted",
+                instance.pk,
+                {**previous, "unless": attrs},
+            )
+
+    transaction.on_commit(publish)
+
+
+@receiver(post_delete)
+def stream_deleted(sender, instance, **kwargs):
+    if sender not in MODEL_SERIALIZERS:
+        return
+    pk = instance.pk
+    attrs = delivery_attrs(instance) if sender is Delivery else None
+    transaction.on_commit(lambda: _publish(instance, "deleted", pk, attrs))
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def invalidate_response_cache(sender, **kwargs):
+    if sender in MODEL_SERIALIZERS:
+        transaction.on_commit(lambda: bump_generation(sender))
+
+
+@receiver(bulk_changed)
+def invalidate_response_cache_in_bulk(sender, using, **kwargs):
+    if sender in MODEL_SERIALIZERS:
+        transaction.on_commit(lambda: bump_generation(sender), using=using)
+
+
+@receiver(bulk_changed)
+def stream_bulk_changed(sender, using, **kwargs):
+    if sender not in MODEL_SERIALIZERS:
+        return
+    # Какие строки затронуты, неизвестно без повторного чтения:
+    # подписчики перезагружают список целиком
+    transaction.on_commit(
+        lambda: broadcaster.publish("reset", "{}"), using=using
+    )
+
+
+@receiver(bulk_changed, sender=Delivery)
+def invalidate_autocomplete_in_bulk(sender, fields, using, **kwargs):
+    for name, attname in AUTOCOMPLETE_FIELDS.items():
+        if fields is None or name in fields or attname in fields:
+            transaction.on_commit(INDEXES[name].invalidate, using=using)
+
+
+def _transport_model_numbers(instance, *pks):
+    numbers = {}
+    if Delivery.transport_model.is_cached(instance):
+        numbers[instance.transport_model_id] = instance.transport_model.number
+    missing = {pk for pk in pks if pk is not None and pk not in numbers}
+    if missing:
+        numbers.update(
+            TransportModel.objects.filter(pk__in=missing).values_list(
+                "pk", "number"
+            )
+        )
+    return numbers
+
+
+@receiver(post_save, sender=Delivery)
+def update_autocomplete(sender, instance, raw, **kwargs):
+    """
+    Переносит вес доставки со старых значений полей на новые. Если
+    значение и давность изменения прежние, индекс не трогается.
+    """
+    if raw:
+        return
+    previous = getattr(instance, "_previous_values", None) or {}
+    old_weight = usage_weight(previous["updated_at"]) if previous else 0
+    new_weight = usage_weight(instance.updated_at)
+    changes = []
+    for name, attname in AUTOCOMPLETE_FIELDS.items():
+        old, new = previous.get(attname), getattr(instance, attname)
+        if old == new and old_weight == new_weight:
+            continue
+        if name == "transport_model":
+            numbers = _transport_model_numbers(instance, old, new)
+            old, new = numbers.get(old), numbers.get(new)
+        changes.append((INDEXES[name], old, new))
+
+    def apply():
+        for index, old, new in changes:
+            if old == new:
+                index.touch(new, new_weight - old_weight)
+            else:
+                index.touch(old, -old_weight)
+                index.touch(new, new_weight)
+
+    if changes:
+        transaction.on_commit(apply)
+
+
+@receiver(post_save, sender=TransportModel)
+def update_transport_model_autocomplete(sender, instance, created, **kwargs):
+    index = INDEXES["transport_model"]
+    if created:
+        transaction.on_commit(lambda: index.touch(instance.number, weight=0))
+    else:
+        transaction.on_commit(index.invalidate)
+
+
+@receiver(bulk_changed, sender=TransportModel)
+def invalidate_transport_model_autocomplete_in_bulk(
+    sender, fields, using, **kwargs
+):
+    if fields is None or "number" in fields:
+        transaction.on_commit(
+            INDEXES["transport_model"].invalidate, using=using
+        )
+
+
+@receiver(post_delete, sender=Delivery)
+@receiver(post_delete, sender=TransportModel)
+def invalidate_autocomplete(sender, **kwargs):
+    for index in INDEXES.values():
+        transaction.on_commit(index.invalidate)
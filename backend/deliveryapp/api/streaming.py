@@ -0,0 +1,313 @@
+"""
+Server-Sent Events поток изменений доставок и справочников.
+
+Каждый клиент — это одна корутина, ожидающая свою очередь, поэтому
+простаивающие подключения не требуют ни потоков, ни опроса БД.
+События сериализуются один раз при публикации и хранятся в кольцевом
+буфере, из которого клиент догоняет пропущенное по ``Last-Event-ID``.
+
+Идентификатор события — ``<эпоха>-<номер>``: номер растёт только внутри
+процесса, а эпоха отличает процессы (и перезапуски) друг от друга, чтобы
+номер из другого воркера не принимался за позицию в своей истории.
+"""
+import asyncio
+import itertools
+import json
+import os
+import secrets
+import threading
+from collections import deque
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import QueryDict
+
+from api.views import DeliveryFilter
+from delivery.analytics import delivery_day
+from delivery.models import Delivery
+
+HISTORY_SIZE = 1000
+HEARTBEAT_INTERVAL = 15
+MAX_PENDING_EVENTS = 500
+
+
+class Message:
+    __slots__ = ("id", "event", "data", "attrs")
+
+    def __init__(self, id, event, data, attrs):
+        self.id = id
+        self.event = event
+        self.data = data
+        self.attrs = attrs
+
+    def encode(self):
+        return (
+            f"id: {self.id}\nevent: {self.event}\ndata: {self.data}\n\n"
+        ).encode()
+
+
+def matches(filters, attrs):
+    """
+    Проверяет событие по фильтрам в духе ``DeliveryFilter``. Событие
+    с ``attrs["unless"]`` не доставляется тем, кто подходит под них.
+    """
+    if attrs is None:
+        # Изменения справочников получают все подписчики
+        return True
+    unless = attrs.get("unless")
+    if unless is not None and matches(filters, unless):
+        return False
+    service = filters.get("service")
+    if service is not None and attrs["service"] != service.pk:
+        return False
+    start_date = filters.get("start_date")
+    if start_date is not None and attrs["day"] < start_date:
+        return False
+    end_date = filters.get("end_date")
+    if end_date is not None and attrs["day"] > end_date:
+        return False
+    return True
+
+
+class Subscription:
+    def __init__(self, filters, loop):
+        self.filters = filters
+        self.loop = loop
+        self.queue = asyncio.Queue()
+        self.closed = False
+
+    def _put(self, message):
+        if self.closed:
+            return
+        if message is not None and self.queue.qsize() >= MAX_PENDING_EVENTS:
+            # Медленный клиент переподключится с Last-Event-ID
+            message = None
+        if message is None:
+            self.closed = True
+        self.queue.put_nowait(message)
+
+    def deliver(self, message):
+        if not matches(self.filters, message.attrs):
+            return
+        try:
+            self.loop.call_soon_threadsafe(self._put, message)
+        except RuntimeError:
+            # Цикл событий уже остановлен
+            self.closed = True
+
+    def close(self):
+        self._put(None)
+
+
+class LocalChannel:
+    """
+    Локальная замена межпроцессной шины (например, Redis pub/sub):
+    доставляет опубликованные события слушателям того же процесса.
+    """
+
+    def __init__(self):
+        self._listeners = []
+
+    def subscribe(self, listener):
+        self._listeners.append(listener)
+
+    def publish(self, event, data, attrs=None):
+        for listener in self._listeners:
+            listener(event, data, attrs)
+
+
+def new_epoch():
+    return f"{os.getpid():x}.{secrets.token_hex(4)}"
+
+
+class Broadcaster:
+    def __init__(self, channel=None, history_size=HISTORY_SIZE):
+        self._history_size = history_size
+        self._reset()
+        self.channel = channel or LocalChannel()
+        self.channel.subscribe(self._dispatch)
+        # С preload_app объект создаётся в мастере gunicorn: каждый
+        # воркер начинает свою эпоху с пустой историей
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self.epoch = new_epoch()
+        self._ids = itertools.count(1)
+        self._last_id = 0
+        self._history = deque(maxlen=self._history_size)
+        self._subscribers = set()
+
+    def _event_id(self, number):
+        return f"{self.epoch}-{number}"
+
+    def _parse_event_id(self, value):
+        """Номер события своей эпохи или ``None`` для чужого ID."""
+        epoch, _, number = value.rpartition("-")
+        if epoch != self.epoch or not number.isdigit():
+            return None
+        return int(number)
+
+    def publish(self, event, data, attrs=None):
+        """Публикует событие; безопасно вызывать из любого потока."""
+        self.channel.publish(event, data, attrs)
+
+    def _dispatch(self, event, data, attrs):
+        with self._lock:
+            self._last_id = next(self._ids)
+            message = Message(
+                self._event_id(self._last_id), event, data, attrs
+            )
+            self._history.append(message)
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.deliver(message)
+
+    def subscribe(self, filters, last_event_id=None):
+        """
+        Регистрирует подписчика и возвращает его вместе с событиями,
+        пропущенными после ``last_event_id``. Если ID выдан другим
+        процессом или история уже вытеснена, вместо них отдаётся событие
+        ``reset``: клиенту нужно перезагрузить данные целиком.
+        """
+        subscription = Subscription(filters, asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers.add(subscription)
+            history = list(self._history)
+            last_id = self._last_id
+        if not last_event_id:
+            return subscription, []
+        number = self._parse_event_id(last_event_id)
+        # Номера в истории идут подряд, начиная с first
+        first = last_id - len(history) + 1
+        if number is None or number > last_id or number + 1 < first:
+            reset = Message(self._event_id(last_id), "reset", "{}", None)
+            return subscription, [reset]
+        missed = [
+            message
+            for message in history[number + 1 - first:]
+            if matches(filters, message.attrs)
+        ]
+        return subscription, missed
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+
+broadcaster = Broadcaster()
+
+
+def delivery_attrs(instance):
+    return {
+        "service": instance.service_id,
+        "day": delivery_day(instance.delivery_datetime),
+    }
+
+
+def previous_delivery_attrs(previous):
+    """Атрибуты доставки до сохранения (по ``_previous_values``)."""
+    return {
+        "service": previous["service_id"],
+        "day": delivery_day(previous["delivery_datetime"]),
+    }
+
+
+def _parse_filters(query):
+    delivery_filter = DeliveryFilter(
+        data=query, queryset=Delivery.objects.none()
+    )
+    if not delivery_filter.is_valid():
+        return None, {
+            field: list(messages)
+            for field, messages in delivery_filter.errors.items()
+        }
+    return delivery_filter.form.cleaned_data, None
+
+
+def _parse_last_event_id(scope, query):
+    headers = dict(scope["headers"])
+    value = headers.get(b"last-event-id", b"").decode() or query.get(
+        "last_event_id"
+    )
+    return value.strip() if value else None
+
+
+def _response_headers(scope, content_type):
+    headers = [
+        (b"content-type", content_type),
+        (b"cache-control", b"no-cache"),
+        (b"x-accel-buffering", b"no"),
+    ]
+    origin = dict(scope["headers"]).get(b"origin", b"").decode()
+    if origin in settings.CORS_ALLOWED_ORIGINS:
+        headers.append((b"access-control-allow-origin", origin.encode()))
+    return headers
+
+
+async def _watch_disconnect(receive, subscription):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+    subscription.close()
+
+
+async def sse_application(scope, receive, send):
+    """ASGI-приложение потока ``text/event-stream``."""
+    query = QueryDict(scope["query_string"].decode("latin-1"))
+    filters, errors = await sync_to_async(_parse_filters)(query)
+    if filters is None:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 400,
+                "headers": _response_headers(scope, b"application/json"),
+            }
+        )
+        await send(
+            {
+                "type": "http.response.body",
+                "body": json.dumps(errors, ensure_ascii=False).encode(),
+            }
+        )
+        return
+
+    subscription, missed = broadcaster.subscribe(
+        filters, _parse_last_event_id(scope, query)
+    )
+    watcher = asyncio.ensure_future(_watch_disconnect(receive, subscription))
+    try:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": _response_headers(scope, b"text/event-stream"),
+            }
+        )
+        for message in missed:
+            await send(
+                {
+                    "type": "http.response.body",
+                    "body": message.encode(),
+                    "more_body": True,
+                }
+            )
+        while True:
+            try:
+                message = await asyncio.wait_for(
+                    subscription.queue.get(), HEARTBEAT_INTERVAL
+                )
+            except asyncio.TimeoutError:
+                body = b": ping\n\n"
+            else:
+                if message is None:
+                    break
+                body = message.encode()
+            await send(
+                {"type": "http.response.body", "body": body, "more_body": True}
+            )
+        await send({"type": "http.response.body", "body": b""})
+    except OSError:
+        pass
+    finally:
+        watcher.cancel()
+        broadcaster.unsubscribe(subscription)
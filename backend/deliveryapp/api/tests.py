@@ -1,3 +1,538 @@
-from django.test import TestCase
+import os
+import tempfile
+import time
+from datetime import date, datetime, timedelta, timezone as dt_timezone
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import (
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    override_settings,
+)
+from rest_framework.request import Request
+from rest_framework.test import APIClient
+
+from api.autocomplete import INDEXES, RECENT_WEIGHT, merge_variants
+from api.files import ACCEL_REDIRECT, _etag_matches, _parse_range
+from api.models import (
+    TechStatus,
+    PackagingType,
+    Service,
+    DeliveryStatus,
+    TransportModel,
+)
+from api.serializers import DeliveryReadSerializer
+from api.streaming import Broadcaster, broadcaster, matches
+from api.views import DeliveryViewSet
+from delivery.models import Delivery
+from deliveryapp.warmup import prime_reference_data
+
+
+class ResponseCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.service = Service.objects.create(name="Доставка")
+        dispatch = datetime(2025, 5, 10, 9, tzinfo=dt_timezone.utc)
+        cls.delivery = Delivery.objects.create(
+            transport_model=TransportModel.objects.create(number="ABC-1"),
+            transport_number="ABC-1",
+            dispatch_datetime=dispatch,
+            delivery_datetime=dispatch + timedelta(hours=2),
+            distance="10 км",
+            service=cls.service,
+            packaging=PackagingType.objects.create(name="Ящик"),
+            status=DeliveryStatus.objects.create(name="В пути"),
+            technical_condition=TechStatus.objects.create(name="Новый"),
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient(HTTP_HOST="localhost")
+
+    def cache_key(self, query, user=None, **kwargs):
+        request = Request(RequestFactory().get("/api/deliveries/" + query))
+        if user is not None:
+            request.user = user
+        view = DeliveryViewSet(
+            basename="deliveries", action="list", request=request
+        )
+        return view.get_cache_key(request, **kwargs)
+
+    def get(self, path):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return response["X-Cache"]
+
+    def test_key_normalises_query(self):
+        key = self.cache_key("?service=1&start_date=2025-05-01")
+
+        self.assertEqual(
+            self.cache_key("?start_date=2025-05-01&service=1"), key
+        )
+        self.assertEqual(
+            self.cache_key("?start_date=2025-05-01&service=1&end_date="), key
+        )
+        self.assertNotEqual(self.cache_key("?service=2"), key)
+        self.assertEqual(
+            self.cache_key("?service=1&service=2"),
+            self.cache_key("?service=2&service=1"),
+        )
+        self.assertEqual(self.cache_key(""), self.cache_key("?service="))
+
+    def test_key_depends_on_user_and_kwargs(self):
+        user = get_user_model().objects.create_user(
+            username="operator", password="secret"
+        )
+
+        self.assertNotEqual(self.cache_key("", user=user), self.cache_key(""))
+        self.assertNotEqual(self.cache_key("", pk="1"), self.cache_key(""))
+
+    def test_save_invalidates_dependent_responses(self):
+        path = "/api/deliveries/"
+        self.assertEqual(self.get(path), "MISS")
+        self.assertEqual(self.get(path), "HIT")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.delivery.comment = "Хрупкое"
+            self.delivery.save()
+        self.assertEqual(self.get(path), "MISS")
+
+        # Справочник входит в cache_dependencies доставок
+        with self.captureOnCommitCallbacks(execute=True):
+            self.service.name = "Экспресс"
+            self.service.save()
+        response = self.client.get(path)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.json()[0]["service"]["name"], "Экспресс")
+
+    def test_bulk_update_invalidates_responses(self):
+        path = f"/api/deliveries/{self.delivery.pk}/"
+        self.get(path)
+        self.assertEqual(self.get(path), "HIT")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Delivery.objects.filter(pk=self.delivery.pk).update(
+                comment="Хрупкое"
+            )
+        response = self.client.get(path)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.json()["comment"], "Хрупкое")
+
+    def test_reference_bulk_changes_invalidate_responses(self):
+        deliveries = "/api/deliveries/"
+        services = "/api/services/"
+        self.get(deliveries)
+        self.get(services)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Service.objects.filter(pk=self.service.pk).update(name="Экспресс")
+        response = self.client.get(deliveries)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.json()[0]["service"]["name"], "Экспресс")
+        self.assertEqual(self.get(services), "MISS")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Service.objects.bulk_create([Service(name="Самовывоз")])
+        response = self.client.get(services)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(len(response.json()), 2)
+
+    def test_attachment_is_exposed_as_protected_url(self):
+        url = f"/api/deliveries/{self.delivery.pk}/attachment/"
+        self.delivery.attachments.name = "deliveries/files/act.pdf"
+
+        self.assertEqual(
+            DeliveryReadSerializer(self.delivery).data["attachments"], url
+        )
+        request = Request(RequestFactory(HTTP_HOST="localhost").get("/"))
+        self.assertEqual(
+            DeliveryReadSerializer(
+                self.delivery, context={"request": request}
+            ).data["attachments"],
+            "http://localhost" + url,
+        )
+        self.delivery.attachments = None
+        self.assertIsNone(
+            DeliveryReadSerializer(self.delivery).data["attachments"]
+        )
+
+    def test_primed_references_are_shared_by_users(self):
+        prime_reference_data()
+        self.client.force_authenticate(
+            get_user_model().objects.create_user(
+                username="operator", password="secret"
+            )
+        )
+
+        self.assertEqual(self.get("/api/services/"), "HIT")
+        self.assertEqual(self.get("/api/tech-statuses/"), "HIT")
+        # Ответы по доставкам по-прежнему раздельные для пользователей
+        self.assertEqual(self.get("/api/deliveries/"), "MISS")
+
+    def test_unrelated_model_keeps_responses(self):
+        path = "/api/services/"
+        self.get(path)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            TechStatus.objects.create(name="Требует ремонта")
+        self.assertEqual(self.get(path), "HIT")
+
+
+class BroadcasterTests(SimpleTestCase):
+    def setUp(self):
+        self.broadcaster = Broadcaster(history_size=3)
+
+    def publish(self, count):
+        for number in range(count):
+            self.broadcaster.publish("service.updated", f'{{"id":{number}}}')
+
+    async def subscribe(self, last_event_id):
+        subscription, missed = self.broadcaster.subscribe({}, last_event_id)
+        self.broadcaster.unsubscribe(subscription)
+        return [(message.id, message.event) for message in missed]
+
+    async def test_replays_missed_events_of_same_epoch(self):
+        self.publish(3)
+        epoch = self.broadcaster.epoch
+
+        self.assertEqual(
+            await self.subscribe(f"{epoch}-1"),
+            [
+                (f"{epoch}-2", "service.updated"),
+                (f"{epoch}-3", "service.updated"),
+            ],
+        )
+        self.assertEqual(await self.subscribe(f"{epoch}-3"), [])
+        self.assertEqual(await self.subscribe(None), [])
+
+    async def test_resets_on_foreign_or_evicted_id(self):
+        self.publish(5)
+        reset = [(f"{self.broadcaster.epoch}-5", "reset")]
+
+        # Номер из другого процесса совпадает с номером в своей истории
+        other = Broadcaster().epoch
+        self.assertEqual(await self.subscribe(f"{other}-4"), reset)
+        self.assertEqual(await self.subscribe("4"), reset)
+        # История из трёх событий уже не содержит второе
+        self.assertEqual(
+            await self.subscribe(f"{self.broadcaster.epoch}-1"), reset
+        )
+        self.assertEqual(
+            await self.subscribe(f"{self.broadcaster.epoch}-9"), reset
+        )
+
+
+class DeliveryStreamTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.services = [
+            Service.objects.create(name=name)
+            for name in ("Доставка", "Экспресс")
+        ]
+        cls.dispatch = datetime(2025, 5, 10, 9, tzinfo=dt_timezone.utc)
+        cls.delivery = Delivery.objects.create(
+            transport_model=TransportModel.objects.create(number="ABC-1"),
+            transport_number="ABC-1",
+            dispatch_datetime=cls.dispatch,
+            delivery_datetime=cls.dispatch + timedelta(hours=2),
+            distance="10 км",
+            service=cls.services[0],
+            status=DeliveryStatus.objects.create(name="В пути"),
+            technical_condition=TechStatus.objects.create(name="Новый"),
+        )
+
+    def received(self, filters, change):
+        """События, которые получит подписчик с фильтрами ``filters``."""
+        messages = []
+
+        def listener(event, data, attrs):
+            messages.append((event, attrs))
+
+        broadcaster.channel.subscribe(listener)
+        self.addCleanup(broadcaster.channel._listeners.remove, listener)
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        return [
+            event for event, attrs in messages if matches(filters, attrs)
+        ]
+
+    def move(self, **values):
+        def change():
+            for name, value in values.items():
+                setattr(self.delivery, name, value)
+            self.delivery.save()
+
+        return change
+
+    def test_moved_delivery_leaves_old_selection(self):
+        first, second = self.services
+        next_day = date(2025, 5, 11)
+
+        self.assertEqual(
+            self.received({"service": first}, self.move(service=second)),
+            ["delivery.deleted"],
+        )
+        self.assertEqual(
+            self.received({"service": second}, self.move(comment="Хрупкое")),
+            ["delivery.updated"],
+        )
+        self.assertEqual(
+            self.received(
+                {"end_date": date(2025, 5, 10)},
+                self.move(
+                    delivery_datetime=self.dispatch + timedelta(days=1)
+                ),
+            ),
+            ["delivery.deleted"],
+        )
+        self.assertEqual(
+            self.received(
+                {"start_date": next_day},
+                self.move(service=first),
+            ),
+            ["delivery.updated"],
+        )
+
+    def test_bulk_changes_reset_subscribers(self):
+        filters = {"service": self.services[0]}
+
+        self.assertEqual(
+            self.received(
+                filters,
+                lambda: Delivery.objects.filter(pk=self.delivery.pk).update(
+                    comment="Хрупкое"
+                ),
+            ),
+            ["reset"],
+        )
+
+
+class AttachmentHeaderTests(SimpleTestCase):
+    def test_parse_range(self):
+        cases = {
+            "bytes=0-99": (0, 99),
+            "bytes=100-": (100, 999),
+            "bytes=900-2000": (900, 999),
+            "bytes=-100": (900, 999),
+            "bytes=-5000": (0, 999),
+            " bytes=0-0 ": (0, 0),
+            # Несколько диапазонов и чужие единицы отдаются целиком
+            "bytes=0-1,5-6": None,
+            "items=0-1": None,
+            "bytes=-": None,
+            # Неудовлетворимые диапазоны — 416
+            "bytes=1000-": False,
+            "bytes=5-4": False,
+            "bytes=-0": False,
+        }
+        for header, expected in cases.items():
+            with self.subTest(header=header):
+                self.assertEqual(_parse_range(header, 1000), expected)
+
+        self.assertIs(_parse_range("bytes=-5", 0), False)
+        self.assertIs(_parse_range("bytes=0-", 0), False)
+
+    def test_if_none_match(self):
+        etag = '"66b1-400"'
+
+        self.assertTrue(_etag_matches(etag, etag))
+        self.assertTrue(_etag_matches(f'"other", W/{etag}', etag))
+        self.assertTrue(_etag_matches("*", etag))
+        self.assertFalse(_etag_matches('"66b1-4000"', etag))
+        self.assertFalse(_etag_matches('"66b1-40"', etag))
+        self.assertFalse(_etag_matches("", etag))
+
+
+class AttachmentViewTests(TestCase):
+    content = bytes(range(256)) * 4
+
+    @classmethod
+    def setUpTestData(cls):
+        dispatch = datetime(2025, 5, 10, 9, tzinfo=dt_timezone.utc)
+        cls.delivery = Delivery.objects.create(
+            transport_model=TransportModel.objects.create(number="ABC-1"),
+            transport_number="ABC-1",
+            dispatch_datetime=dispatch,
+            delivery_datetime=dispatch + timedelta(hours=2),
+            distance="10 км",
+            status=DeliveryStatus.objects.create(name="В пути"),
+            technical_condition=TechStatus.objects.create(name="Новый"),
+            attachments="deliveries/files/report.pdf",
+        )
+        cls.user = get_user_model().objects.create_user("operator")
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings = override_settings(MEDIA_ROOT=media.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        os.makedirs(os.path.join(media.name, "deliveries", "files"))
+        path = os.path.join(media.name, self.delivery.attachments.name)
+        with open(path, "wb") as file:
+            file.write(self.content)
+
+        self.client = APIClient(HTTP_HOST="localhost")
+        self.client.force_authenticate(self.user)
+        self.url = f"/api/deliveries/{self.delivery.pk}/attachment/"
+
+    def test_requires_authentication(self):
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_missing_file(self):
+        Delivery.objects.filter(pk=self.delivery.pk).update(
+            attachments="deliveries/files/missing.pdf"
+        )
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_full_response(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), self.content)
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertIn("report.pdf", response["Content-Disposition"])
+        self.assertTrue(response["ETag"].startswith('"'))
+
+    def test_range(self):
+        response = self.client.get(self.url, HTTP_RANGE="bytes=100-199")
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(
+            b"".join(response.streaming_content), self.content[100:200]
+        )
+        self.assertEqual(response["Content-Range"], "bytes 100-199/1024")
+        self.assertEqual(response["Content-Length"], "100")
+
+    def test_if_none_match(self):
+        etag = self.client.get(self.url)["ETag"]
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+    @override_settings(ACCEL_REDIRECT_PREFIX="/protected-media/")
+    def test_accel_redirect(self):
+        response = self.client.get(
+            self.url, HTTP_X_SENDFILE_TYPE=ACCEL_REDIRECT
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response[ACCEL_REDIRECT],
+            "/protected-media/deliveries/files/report.pdf",
+        )
+        self.assertEqual(response.content, b"")
+        self.assertEqual(response["Content-Type"], "application/pdf")
+
+
+class AutocompleteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.transport_models = [
+            TransportModel.objects.create(number=number)
+            # Латиница: LIKE в SQLite не учитывает регистр только для ASCII
+            for number in ("Gazel", "GAZon")
+        ]
+        cls.status = DeliveryStatus.objects.create(name="В пути")
+        cls.tech_status = TechStatus.objects.create(name="Новый")
+
+    def setUp(self):
+        self.addCleanup(self.reset_indexes)
+
+    def reset_indexes(self):
+        for index in INDEXES.values():
+            index.invalidate()
+            index._building = False
+
+    def create(self, transport_number, collector="", transport_model=None):
+        dispatch = datetime(2025, 5, 10, 9, tzinfo=dt_timezone.utc)
+        with self.captureOnCommitCallbacks(execute=True):
+            return Delivery.objects.create(
+                transport_model=transport_model or self.transport_models[0],
+                transport_number=transport_number,
+                collector=collector,
+                dispatch_datetime=dispatch,
+                delivery_datetime=dispatch + timedelta(hours=2),
+                distance="10 км",
+                status=self.status,
+                technical_condition=self.tech_status,
+            )
+
+    def build(self):
+        # Синхронно, без фонового потока и закрытия соединений
+        for index in INDEXES.values():
+            index._entries = merge_variants(index.source.load())
+            index._keys = sorted(index._entries)
+            index._built_at = time.monotonic()
+
+    def search(self, field, prefix):
+        return INDEXES[field].search(prefix)
+
+    def test_index_and_fallback_agree(self):
+        for number in ("ab-1", "AB-1", "AB-1", "ab-2", "xy-1"):
+            self.create(number)
+        weight = 1 + RECENT_WEIGHT
+        expected = [("AB-1", 3 * weight), ("ab-2", weight)]
+
+        # Индекс ещё не построен: ответ из БД
+        for index in INDEXES.values():
+            index._building = True
+        self.assertEqual(self.search("transport_number", "Ab"), expected)
+        self.assertEqual(
+            self.search("transport_model", "gaz"),
+            [("Gazel", 5 * weight), ("GAZon", 0)],
+        )
+
+        self.build()
+        self.assertEqual(self.search("transport_number", "Ab"), expected)
+        self.assertEqual(
+            self.search("transport_model", "gaz"),
+            [("Gazel", 5 * weight), ("GAZon", 0)],
+        )
+
+    def test_save_moves_weight_of_changed_fields(self):
+        delivery = self.create("ab-1", collector="Иванов")
+        self.build()
+        weight = 1 + RECENT_WEIGHT
+
+        with self.captureOnCommitCallbacks(execute=True):
+            delivery.comment = "Без изменения подсказок"
+            delivery.save()
+        self.assertEqual(
+            self.search("transport_number", "ab"), [("ab-1", weight)]
+        )
+        self.assertEqual(self.search("collector", "ив"), [("Иванов", weight)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            delivery.transport_number = "ab-2"
+            delivery.transport_model = self.transport_models[1]
+            delivery.save()
+        self.assertEqual(
+            self.search("transport_number", "ab"), [("ab-2", weight)]
+        )
+        self.assertEqual(self.search("collector", "ив"), [("Иванов", weight)])
+        self.assertEqual(
+            self.search("transport_model", "gaz"),
+            [("GAZon", weight), ("Gazel", 0)],
+        )
+
+    def test_bulk_update_invalidates_index(self):
+        delivery = self.create("ab-1")
+        self.build()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Delivery.objects.filter(pk=delivery.pk).update(comment="Хрупкое")
+        self.assertIsNotNone(INDEXES["transport_number"]._built_at)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Delivery.objects.filter(pk=delivery.pk).update(
+                transport_number="ab-2"
+            )
+        self.assertIsNone(INDEXES["transport_number"]._built_at)
+        self.assertIsNotNone(INDEXES["collector"]._built_at)
@@ -7,6 +7,8 @@ from api.views import (
     ServiceViewSet,
     DeliveryStatusViewSet,
     TransportModelViewSet,
+    cache_stats,
+    autocomplete,
 )
 
 router = DefaultRouter()
@@ -24,5 +26,7 @@ router.register(
 )
 
 urlpatterns = [
+    path("api/cache-stats/", cache_stats, name="cache-stats"),
+    path("api/autocomplete/", autocomplete, name="autocomplete"),
     path("api/", include(router.urls)),
 ]
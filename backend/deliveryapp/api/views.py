@@ -1,4 +1,8 @@
+from django.http import Http404
 from rest_framework import viewsets
+from rest_framework.decorators import action, api_view
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
 
 from django_filters.rest_framework import (
     DjangoFilterBackend,
@@ -7,7 +11,12 @@ from django_filters.rest_framework import (
     ModelChoiceFilter,
 )
 
-from delivery.models import Delivery
+from api.autocomplete import INDEXES
+from api.cache import CachedResponseMixin, get_stats
+from api.files import attachment_response
+from delivery.analytics import transit_percentiles
+from delivery.events import FIELD_NAMES, delivery_timeline, dwell_times
+from delivery.models import Delivery, TransitTimeSketch
 from api.models import (
     TechStatus,
     PackagingType,
@@ -23,8 +32,18 @@ from api.serializers import (
     ServiceSerializer,
     DeliveryStatusSerializer,
     TransportModelSerializer,
+    TransitTimeQuerySerializer,
+    DeliveryEventSerializer,
+    DwellTimeQuerySerializer,
+    AutocompleteQuerySerializer,
 )
 
+TRANSIT_DIMENSION_MODELS = {
+    TransitTimeSketch.DIMENSION_SERVICE: Service,
+    TransitTimeSketch.DIMENSION_PACKAGING: PackagingType,
+    TransitTimeSketch.DIMENSION_TRANSPORT_MODEL: TransportModel,
+}
+
 
 class DeliveryFilter(FilterSet):
     start_date = DateFilter(field_name="delivery_datetime", lookup_expr="gte")
@@ -36,8 +55,16 @@ class DeliveryFilter(FilterSet):
         fields = ["start_date", "end_date", "service"]
 
 
-class DeliveryViewSet(viewsets.ModelViewSet):
+class DeliveryViewSet(CachedResponseMixin, viewsets.ModelViewSet):
     queryset = Delivery.objects.all()
+    cache_dependencies = (
+        Delivery,
+        TransportModel,
+        Service,
+        PackagingType,
+        DeliveryStatus,
+        TechStatus,
+    )
     filter_backends = [DjangoFilterBackend]
     filterset_class = DeliveryFilter
 
@@ -48,27 +75,144 @@ class DeliveryViewSet(viewsets.ModelViewSet):
             else DeliveryReadSerializer
         )
 
+    @action(
+        detail=True,
+        methods=["get"],
+        permission_classes=[IsAuthenticated],
+    )
+    def attachment(self, request, pk=None):
+        """Скачивание вложения доставки после проверки прав."""
+        delivery = self.get_object()
+        if not delivery.attachments or not delivery.attachments.storage.exists(
+            delivery.attachments.name
+        ):
+            raise Http404
+        return attachment_response(request, delivery.attachments)
+
+    @action(detail=True, methods=["get"])
+    def events(self, request, pk=None):
+        """Хронология изменений статуса и состояния доставки."""
+        delivery = self.get_object()
+        return Response(
+            DeliveryEventSerializer(
+                delivery_timeline(delivery.pk), many=True
+            ).data
+        )
+
+    @action(detail=False, methods=["get"], url_path="dwell-times")
+    def dwell_times(self, request):
+        """Время пребывания доставок в каждом значении поля за период."""
+        params = DwellTimeQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        field = params.validated_data["field"]
+        stats = dwell_times(
+            FIELD_NAMES[field],
+            start=params.validated_data.get("start"),
+            end=params.validated_data.get("end"),
+        )
+
+        if field == "finished":
+            names = {0: "Нет", 1: "Да"}
+        else:
+            model = DeliveryStatus if field == "status" else TechStatus
+            names = {
+                obj.pk: str(obj)
+                for obj in model.objects.filter(pk__in=stats)
+            }
+        results = [
+            {"value": value, "name": names.get(value), **item}
+            for value, item in sorted(stats.items())
+        ]
+        return Response({"field": field, "results": results})
+
+    @action(detail=False, methods=["get"], url_path="transit-time")
+    def transit_time(self, request):
+        """Квантили времени в пути (в секундах) по посуточным скетчам."""
+        params = TransitTimeQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        dimension = params.validated_data["dimension"]
+        quantiles = params.validated_data["quantiles"]
+        stats = transit_percentiles(
+            dimension,
+            quantiles,
+            start_date=params.validated_data.get("start_date"),
+            end_date=params.validated_data.get("end_date"),
+        )
 
-class TechStatusViewSet(viewsets.ModelViewSet):
+        names = {}
+        if dimension in TRANSIT_DIMENSION_MODELS:
+            names = {
+                obj.pk: str(obj)
+                for obj in TRANSIT_DIMENSION_MODELS[dimension].objects.filter(
+                    pk__in=stats
+                )
+            }
+        results = [
+            {
+                "id": dimension_id or None,
+                "name": names.get(dimension_id),
+                "count": item["count"],
+                **{
+                    f"p{q * 100:g}": item["quantiles"][q]
+                    for q in quantiles
+                },
+            }
+            for dimension_id, item in sorted(stats.items())
+        ]
+        return Response({"dimension": dimension, "results": results})
+
+
+class ReferenceViewSet(CachedResponseMixin, viewsets.ModelViewSet):
+    """Справочник: содержимое не зависит от пользователя."""
+
+    cache_per_user = False
+
+
+class TechStatusViewSet(ReferenceViewSet):
     queryset = TechStatus.objects.all()
     serializer_class = TechStatusSerializer
 
 
-class PackagingTypeViewSet(viewsets.ModelViewSet):
+class PackagingTypeViewSet(ReferenceViewSet):
     queryset = PackagingType.objects.all()
     serializer_class = PackagingTypeSerializer
 
 
-class ServiceViewSet(viewsets.ModelViewSet):
+class ServiceViewSet(ReferenceViewSet):
     queryset = Service.objects.all()
     serializer_class = ServiceSerializer
 
 
-class DeliveryStatusViewSet(viewsets.ModelViewSet):
+class DeliveryStatusViewSet(ReferenceViewSet):
     queryset = DeliveryStatus.objects.all()
     serializer_class = DeliveryStatusSerializer
 
 
-class TransportModelViewSet(viewsets.ModelViewSet):
+class TransportModelViewSet(ReferenceViewSet):
     queryset = TransportModel.objects.all()
     serializer_class = TransportModelSerializer
+
+
+@api_view(["GET"])
+def cache_stats(request):
+    """Счётчики попаданий и промахов кэша ответов текущего процесса."""
+    return Response(get_stats())
+
+
+@api_view(["GET"])
+def autocomplete(request):
+    """Подсказки по префиксу, отсортированные по частоте использования."""
+    params = AutocompleteQuerySerializer(data=request.query_params)
+    params.is_valid(raise_exception=True)
+    field = params.validated_data["field"]
+    results = INDEXES[field].search(
+        params.validated_data["q"], params.validated_data["limit"]
+    )
+    return Response(
+        {
+            "field": field,
+            "results": [
+                {"value": value, "score": score} for value, score in results
+            ],
+        }
+    )
@@ -0,0 +1,130 @@
+import threading
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from delivery.models import Delivery, TransitTimeSketch
+from delivery.sketches import TDigest
+
+# Поле доставки для каждого измерения скетчей
+DIMENSION_FIELDS = {
+    TransitTimeSketch.DIMENSION_SERVICE: "service_id",
+    TransitTimeSketch.DIMENSION_PACKAGING: "packaging_id",
+    TransitTimeSketch.DIMENSION_TRANSPORT_MODEL: "transport_model_id",
+}
+
+# Поля доставки, от которых зависят скетчи
+SKETCH_FIELDS = (
+    "dispatch_datetime",
+    "delivery_datetime",
+    *DIMENSION_FIELDS.values(),
+)
+
+_pending = threading.local()
+
+
+def delivery_day(value):
+    """День, к которому относится доставка (как в ``DeliveryFilter``)."""
+    if timezone.is_aware(value):
+        value = timezone.localtime(value)
+    return value.date()
+
+
+def affects_sketches(fields):
+    """Затрагивает ли изменение полей ``fields`` (``None`` — все) скетчи."""
+    return fields is None or any(
+        attname in fields or attname.removesuffix("_id") in fields
+        for attname in SKETCH_FIELDS
+    )
+
+
+def rebuild_transit_sketches(days):
+    """Пересчитывает скетчи за указанные дни по строкам доставок."""
+    for day in sorted(set(days)):
+        values = defaultdict(list)
+        rows = Delivery.objects.filter(delivery_datetime__date=day).values(
+            *SKETCH_FIELDS
+        )
+        for row in rows:
+            seconds = (
+                row["delivery_datetime"] - row["dispatch_datetime"]
+            ).total_seconds()
+            values[(TransitTimeSketch.DIMENSION_ALL, 0)].append(seconds)
+            for dimension, field in DIMENSION_FIELDS.items():
+                values[(dimension, row[field] or 0)].append(seconds)
+
+        # Upsert вместо «удалить и вставить»: параллельные пересчёты
+        # одного дня не сталкиваются на unique_transit_sketch
+        sketches = [
+            TransitTimeSketch(
+                day=day,
+                dimension=dimension,
+                dimension_id=dimension_id,
+                count=len(seconds),
+                digest=TDigest().update(seconds).to_bytes(),
+            )
+            for (dimension, dimension_id), seconds in sorted(values.items())
+        ]
+        keep = Q(pk__in=[])
+        for sketch in sketches:
+            keep |= Q(
+                dimension=sketch.dimension, dimension_id=sketch.dimension_id
+            )
+        with transaction.atomic():
+            TransitTimeSketch.objects.bulk_create(
+                sketches,
+                update_conflicts=True,
+                unique_fields=["dimension", "day", "dimension_id"],
+                update_fields=["count", "digest"],
+            )
+            TransitTimeSketch.objects.filter(day=day).exclude(keep).delete()
+
+
+def _flush_pending_days():
+    days = getattr(_pending, "days", None)
+    _pending.days = None
+    if days:
+        rebuild_transit_sketches(days)
+
+
+def schedule_sketch_rebuild(days):
+    """
+    Откладывает пересчёт скетчей до фиксации транзакции, чтобы
+    несколько изменений за один день пересчитывались один раз.
+    """
+    if getattr(_pending, "days", None) is None:
+        _pending.days = set()
+    _pending.days.update(days)
+    transaction.on_commit(_flush_pending_days)
+
+
+def transit_percentiles(dimension, quantiles, start_date=None, end_date=None):
+    """
+    Объединяет посуточные скетчи за период и возвращает квантили
+    времени в пути (в секундах) по каждому значению измерения.
+    """
+    sketches = TransitTimeSketch.objects.filter(dimension=dimension)
+    if start_date:
+        sketches = sketches.filter(day__gte=start_date)
+    if end_date:
+        sketches = sketches.filter(day__lte=end_date)
+
+    digests = {}
+    for dimension_id, digest in sketches.values_list(
+        "dimension_id", "digest"
+    ).iterator():
+        day_digest = TDigest.from_bytes(digest)
+        if dimension_id in digests:
+            digests[dimension_id].merge(day_digest)
+        else:
+            digests[dimension_id] = day_digest
+
+    return {
+        dimension_id: {
+            "count": int(digest.count),
+            "quantiles": {q: digest.quantile(q) for q in quantiles},
+        }
+        for dimension_id, digest in digests.items()
+    }
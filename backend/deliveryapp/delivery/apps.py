@@ -6,3 +6,6 @@ class DeliveryConfig(AppConfig):
     name = "delivery"
     verbose_name = "Доставка"
     verbose_name_plural = "Доставки"
+
+    def ready(self):
+        from delivery import signals  # noqa: F401
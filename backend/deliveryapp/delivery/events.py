@@ -0,0 +1,174 @@
+"""
+Журнал изменений состояния доставок.
+
+События копятся в памяти и записываются одним ``bulk_create`` после
+фиксации транзакции, в которой произошли изменения.
+"""
+import threading
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F, Window
+from django.db.models.functions import Lead
+from django.utils import timezone
+
+from delivery.models import DeliveryEvent
+
+# Отслеживаемые поля доставки: код поля -> имя атрибута модели
+TRACKED_FIELDS = {
+    DeliveryEvent.FIELD_STATUS: "status_id",
+    DeliveryEvent.FIELD_TECHNICAL_CONDITION: "technical_condition_id",
+    DeliveryEvent.FIELD_FINISHED: "finished",
+}
+
+# Имена полей в API
+FIELD_NAMES = {
+    "status": DeliveryEvent.FIELD_STATUS,
+    "technical_condition": DeliveryEvent.FIELD_TECHNICAL_CONDITION,
+    "finished": DeliveryEvent.FIELD_FINISHED,
+}
+
+_local = threading.local()
+
+
+class _Batch:
+    def __init__(self, batches, key):
+        self.batches = batches
+        self.key = key
+        self.events = []
+
+    def flush(self):
+        self.batches.pop(self.key, None)
+        DeliveryEvent.objects.using(self.key[0]).bulk_create(self.events)
+
+
+def _batches(connection):
+    # Пачки живут до конца транзакции: Django заменяет список колбэков
+    # при фиксации и откате, и вместе с ним сбрасываются пачки, чьи
+    # колбэки уже выполнены или отброшены
+    if not hasattr(_local, "pending"):
+        _local.pending = {}
+    hooks, batches = _local.pending.get(connection.alias, (None, None))
+    if hooks is not connection.run_on_commit:
+        batches = {}
+        _local.pending[connection.alias] = (connection.run_on_commit, batches)
+    return batches
+
+
+def _write(events, using=None):
+    events = list(events)
+    if not events:
+        return
+    connection = transaction.get_connection(using)
+    if not connection.in_atomic_block:
+        DeliveryEvent.objects.using(using).bulk_create(events)
+        return
+
+    # Пачка привязана к точке сохранения, в которой зарегистрирован её
+    # колбэк: при откате точки Django удаляет колбэк, и события пропадают
+    # вместе с ним. Имена точек уникальны в пределах соединения, поэтому
+    # события из новой точки сохранения идут в новую пачку.
+    batches = _batches(connection)
+    key = (connection.alias, tuple(connection.savepoint_ids))
+    batch = batches.get(key)
+    if batch is None:
+        batch = batches[key] = _Batch(batches, key)
+        transaction.on_commit(batch.flush, using=using)
+    batch.events.extend(events)
+
+
+def record_initial_events(deliveries, using=None):
+    """Начальные значения отслеживаемых полей новых доставок."""
+    now = timezone.now()
+    _write(
+        (
+            DeliveryEvent(
+                delivery_id=delivery.pk,
+                field=field,
+                value=int(getattr(delivery, attname)),
+                created_at=now,
+            )
+            for delivery in deliveries
+            for field, attname in TRACKED_FIELDS.items()
+            if getattr(delivery, attname) is not None
+        ),
+        using,
+    )
+
+
+def record_changes(changes, using=None):
+    """
+    Принимает тройки ``(pk, старые значения, новые значения)``, где
+    значения — словари по именам атрибутов, и пишет события только
+    для изменившихся полей.
+    """
+    now = timezone.now()
+    _write(
+        (
+            DeliveryEvent(
+                delivery_id=pk,
+                field=field,
+                value=int(after[attname]),
+                created_at=now,
+            )
+            for pk, before, after in changes
+            for field, attname in TRACKED_FIELDS.items()
+            if attname in after and before.get(attname) != after[attname]
+        ),
+        using,
+    )
+
+
+def delivery_timeline(delivery_id):
+    """События доставки в хронологическом порядке."""
+    return DeliveryEvent.objects.filter(delivery_id=delivery_id).order_by(
+        "created_at", "pk"
+    )
+
+
+def dwell_times(field, start=None, end=None):
+    """
+    Время пребывания в каждом значении поля для интервалов, начавшихся
+    в периоде ``[start, end]``. Незавершённые интервалы считаются
+    до текущего момента.
+
+    Возвращает словарь ``значение -> {"entries", "open", "total_seconds",
+    "avg_seconds"}``; ``entries`` — число переходов в значение
+    (пропускная способность этапа).
+    """
+    in_period = DeliveryEvent.objects.filter(field=field)
+    if start:
+        in_period = in_period.filter(created_at__gte=start)
+    if end:
+        in_period = in_period.filter(created_at__lte=end)
+    events = (
+        DeliveryEvent.objects.filter(
+            field=field, delivery_id__in=in_period.values("delivery_id")
+        )
+        .annotate(
+            left_at=Window(
+                Lead("created_at"),
+                partition_by=[F("delivery_id")],
+                order_by=[F("created_at").asc(), F("pk").asc()],
+            )
+        )
+        .values_list("value", "created_at", "left_at")
+    )
+    now = timezone.now()
+    stats = defaultdict(
+        lambda: {"entries": 0, "open": 0, "total_seconds": 0.0}
+    )
+    for value, entered_at, left_at in events.iterator():
+        # Оконная функция должна видеть всю историю доставки, поэтому
+        # период применяется уже после её вычисления
+        if (start and entered_at < start) or (end and entered_at > end):
+            continue
+        item = stats[value]
+        item["entries"] += 1
+        if left_at is None:
+            item["open"] += 1
+            left_at = now
+        item["total_seconds"] += (left_at - entered_at).total_seconds()
+    for item in stats.values():
+        item["avg_seconds"] = item["total_seconds"] / item["entries"]
+    return dict(stats)
@@ -0,0 +1,81 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from delivery.models import Delivery
+from delivery.snapshots import Snapshot
+
+
+def _best_of(repeat, func):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает группировку доставок по услугам и статусам "
+        "на последнем снимке и через ORM"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", help="Каталог снимков")
+        parser.add_argument("--start-date", type=date.fromisoformat)
+        parser.add_argument("--end-date", type=date.fromisoformat)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        start, end = options["start_date"], options["end_date"]
+
+        def orm():
+            deliveries = Delivery.objects.all()
+            if start:
+                deliveries = deliveries.filter(
+                    delivery_datetime__date__gte=start
+                )
+            if end:
+                deliveries = deliveries.filter(
+                    delivery_datetime__date__lte=end
+                )
+            return {
+                column: {
+                    key or 0: count
+                    for key, count in deliveries.order_by()
+                    .values_list(column)
+                    .annotate(count=Count("pk"))
+                }
+                for column in ("service", "status")
+            }
+
+        open_time, data = _best_of(
+            1, lambda: Snapshot.latest(options["output"])
+        )
+
+        def snapshot():
+            mask = data.filter(start_date=start, end_date=end)
+            return {
+                column: {
+                    key: item["count"]
+                    for key, item in data.group_by(column, mask=mask).items()
+                }
+                for column in ("service", "status")
+            }
+
+        orm_time, orm_result = _best_of(options["repeat"], orm)
+        snapshot_time, snapshot_result = _best_of(options["repeat"], snapshot)
+        self.stdout.write(f"ORM:    {orm_time * 1000:.2f} мс")
+        self.stdout.write(
+            f"Снимок: {snapshot_time * 1000:.2f} мс "
+            f"(открытие {open_time * 1000:.2f} мс, строк {len(data)})"
+        )
+        if orm_result == snapshot_result:
+            self.stdout.write(self.style.SUCCESS("Результаты совпадают"))
+        else:
+            self.stdout.write(
+                self.style.WARNING("Результаты расходятся (снимок устарел?)")
+            )
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from delivery.snapshots import prune_snapshots, write_snapshot
+
+
+class Command(BaseCommand):
+    help = "Записывает колоночный снимок доставок для офлайн-аналитики"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output",
+            help="Каталог снимков (по умолчанию SNAPSHOT_ROOT)",
+        )
+        parser.add_argument(
+            "--keep",
+            type=int,
+            default=7,
+            help="Сколько последних снимков оставить (не меньше 1)",
+        )
+
+    def handle(self, *args, **options):
+        if options["keep"] < 1:
+            # Новый снимок тоже удалился бы, а LATEST указывал бы в никуда
+            raise CommandError("--keep должен быть не меньше 1")
+        path = write_snapshot(options["output"])
+        prune_snapshots(options["output"], keep=options["keep"])
+        self.stdout.write(self.style.SUCCESS(f"Снимок записан: {path}"))
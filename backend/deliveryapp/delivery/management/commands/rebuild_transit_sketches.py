@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from delivery.analytics import delivery_day, rebuild_transit_sketches
+from delivery.models import Delivery, TransitTimeSketch
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает посуточные скетчи времени в пути"
+
+    def handle(self, *args, **options):
+        days = {
+            delivery_day(value)
+            for value in Delivery.objects.values_list(
+                "delivery_datetime", flat=True
+            ).iterator()
+        }
+        days.update(TransitTimeSketch.objects.values_list("day", flat=True))
+        rebuild_transit_sketches(days)
+        self.stdout.write(
+            self.style.SUCCESS(f"Пересчитано дней: {len(days)}")
+        )
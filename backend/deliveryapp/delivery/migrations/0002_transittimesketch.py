@@ -0,0 +1,29 @@
+# Generated by Django 5.2.1 on 2026-10-19 16:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransitTimeSketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День доставки')),
+                ('dimension', models.CharField(choices=[('all', 'Все доставки'), ('service', 'Услуга'), ('packaging', 'Тип упаковки'), ('transport_model', 'Модель транспорта')], max_length=20, verbose_name='Измерение')),
+                ('dimension_id', models.PositiveBigIntegerField(default=0, verbose_name='ID значения')),
+                ('count', models.PositiveIntegerField(verbose_name='Количество доставок')),
+                ('digest', models.BinaryField(verbose_name='Дайджест')),
+            ],
+            options={
+                'verbose_name': 'Скетч времени в пути',
+                'verbose_name_plural': 'Скетчи времени в пути',
+                'constraints': [models.UniqueConstraint(fields=('dimension', 'day', 'dimension_id'), name='unique_transit_sketch')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.1 on 2026-10-19 16:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0002_transittimesketch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeliveryEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field', models.PositiveSmallIntegerField(choices=[(1, 'Статус доставки'), (2, 'Техническое состояние'), (3, 'Завершена')], verbose_name='Поле')),
+                ('value', models.BigIntegerField(verbose_name='Значение')),
+                ('created_at', models.DateTimeField(verbose_name='Время изменения')),
+                ('delivery', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='events', to='delivery.delivery', verbose_name='Доставка')),
+            ],
+            options={
+                'verbose_name': 'Событие доставки',
+                'verbose_name_plural': 'События доставок',
+                'indexes': [models.Index(fields=['delivery', 'created_at'], name='delivery_event_timeline'), models.Index(fields=['field', 'created_at'], name='delivery_event_field_time')],
+            },
+        ),
+    ]
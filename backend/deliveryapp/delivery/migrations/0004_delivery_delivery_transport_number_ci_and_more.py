@@ -0,0 +1,24 @@
+# Generated by Django 5.2.1 on 2026-10-19 16:32
+
+import api.models
+import django.db.models.functions.text
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_transportmodel_transport_model_number_ci'),
+        ('delivery', '0003_deliveryevent'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='delivery',
+            index=api.models.PatternOpsIndex(django.db.models.functions.text.Upper('transport_number'), name='delivery_transport_number_ci'),
+        ),
+        migrations.AddIndex(
+            model_name='delivery',
+            index=api.models.PatternOpsIndex(django.db.models.functions.text.Upper('collector'), name='delivery_collector_ci'),
+        ),
+    ]
@@ -1,6 +1,9 @@
 # models.py in app `deliveries`
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Upper
 from api.models import (
+    PatternOpsIndex,
+    bulk_changed,
     TransportModel,
     PackagingType,
     Service,
@@ -9,6 +12,78 @@ from api.models import (
 )
 
 
+def _tracked_attnames(fields):
+    from delivery.events import TRACKED_FIELDS
+
+    return [
+        attname
+        for attname in TRACKED_FIELDS.values()
+        if attname in fields or attname.removesuffix("_id") in fields
+    ]
+
+
+class DeliveryQuerySet(models.QuerySet):
+    """
+    Массовые операции, которые тоже пишут журнал ``DeliveryEvent``
+    и отправляют ``bulk_changed``. ``bulk_update`` выполняется через
+    ``update`` и отдельной обработки не требует.
+    """
+
+    def _values_by_pk(self, queryset, attnames):
+        return {
+            pk: dict(zip(attnames, values))
+            for pk, *values in queryset.values_list("pk", *attnames)
+        }
+
+    def bulk_create(self, objs, *args, **kwargs):
+        from delivery.analytics import delivery_day
+        from delivery.events import record_initial_events
+
+        objs = super().bulk_create(objs, *args, **kwargs)
+        record_initial_events(
+            (obj for obj in objs if obj.pk is not None), self.db
+        )
+        bulk_changed.send(
+            sender=self.model,
+            days={delivery_day(obj.delivery_datetime) for obj in objs},
+            fields=None,
+            using=self.db,
+        )
+        return objs
+
+    def update(self, **kwargs):
+        from delivery.analytics import delivery_day
+        from delivery.events import record_changes
+
+        tracked = _tracked_attnames(kwargs)
+        attnames = ["delivery_datetime", *tracked]
+        with transaction.atomic(using=self.db):
+            before = self._values_by_pk(self.select_for_update(), attnames)
+            rows = super().update(**kwargs)
+            after = before
+            if tracked or "delivery_datetime" in kwargs:
+                after = self._values_by_pk(
+                    self.model._base_manager.using(self.db).filter(
+                        pk__in=before
+                    ),
+                    attnames,
+                )
+            record_changes(
+                ((pk, before[pk], values) for pk, values in after.items()),
+                self.db,
+            )
+            bulk_changed.send(
+                sender=self.model,
+                days={
+                    delivery_day(values["delivery_datetime"])
+                    for values in (*before.values(), *after.values())
+                },
+                fields=set(kwargs),
+                using=self.db,
+            )
+        return rows
+
+
 class Delivery(models.Model):
     """
     Модель доставки, соответствующая форме создания.
@@ -83,13 +158,111 @@ class Delivery(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = DeliveryQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Доставка"
         verbose_name_plural = "Доставки"
         ordering = ["-dispatch_datetime"]
+        # Для запросов UPPER(field) LIKE 'PREFIX%' (istartswith) в PostgreSQL
+        indexes = [
+            PatternOpsIndex(
+                Upper("transport_number"), name="delivery_transport_number_ci"
+            ),
+            PatternOpsIndex(Upper("collector"), name="delivery_collector_ci"),
+        ]
 
     def __str__(self):
         return (
             f"Доставка #{self.pk} — "
             f"{self.transport_model} №{self.transport_number}"
         )
+
+
+class TransitTimeSketch(models.Model):
+    """
+    Посуточный t-digest времени в пути (delivery - dispatch, в секундах)
+    в разрезе одного измерения.
+    """
+
+    DIMENSION_ALL = "all"
+    DIMENSION_SERVICE = "service"
+    DIMENSION_PACKAGING = "packaging"
+    DIMENSION_TRANSPORT_MODEL = "transport_model"
+    DIMENSION_CHOICES = (
+        (DIMENSION_ALL, "Все доставки"),
+        (DIMENSION_SERVICE, "Услуга"),
+        (DIMENSION_PACKAGING, "Тип упаковки"),
+        (DIMENSION_TRANSPORT_MODEL, "Модель транспорта"),
+    )
+
+    day = models.DateField("День доставки")
+    dimension = models.CharField(
+        "Измерение", max_length=20, choices=DIMENSION_CHOICES
+    )
+    # 0 — без разбивки или значение не указано
+    dimension_id = models.PositiveBigIntegerField("ID значения", default=0)
+    count = models.PositiveIntegerField("Количество доставок")
+    digest = models.BinaryField("Дайджест")
+
+    class Meta:
+        verbose_name = "Скетч времени в пути"
+        verbose_name_plural = "Скетчи времени в пути"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["dimension", "day", "dimension_id"],
+                name="unique_transit_sketch",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.dimension}={self.dimension_id}"
+
+
+class DeliveryEvent(models.Model):
+    """
+    Запись журнала изменений статуса, технического состояния
+    и завершённости доставки. Записи только добавляются.
+    """
+
+    FIELD_STATUS = 1
+    FIELD_TECHNICAL_CONDITION = 2
+    FIELD_FINISHED = 3
+    FIELD_CHOICES = (
+        (FIELD_STATUS, "Статус доставки"),
+        (FIELD_TECHNICAL_CONDITION, "Техническое состояние"),
+        (FIELD_FINISHED, "Завершена"),
+    )
+
+    # Без ограничения внешнего ключа: история переживает удаление доставки
+    delivery = models.ForeignKey(
+        Delivery,
+        verbose_name="Доставка",
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name="events",
+    )
+    field = models.PositiveSmallIntegerField("Поле", choices=FIELD_CHOICES)
+    # ID справочника или 0/1 для признака завершённости
+    value = models.BigIntegerField("Значение")
+    created_at = models.DateTimeField("Время изменения")
+
+    class Meta:
+        verbose_name = "Событие доставки"
+        verbose_name_plural = "События доставок"
+        indexes = [
+            models.Index(
+                fields=["delivery", "created_at"],
+                name="delivery_event_timeline",
+            ),
+            models.Index(
+                fields=["field", "created_at"],
+                name="delivery_event_field_time",
+            ),
+        ]
+
+    def __str__(self):
+        return (
+            f"Доставка #{self.delivery_id}: "
+            f"{self.get_field_display()} = {self.value}"
+        )
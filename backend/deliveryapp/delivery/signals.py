@@ -0,0 +1,88 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from delivery.analytics import (
+    SKETCH_FIELDS,
+    affects_sketches,
+    delivery_day,
+    schedule_sketch_rebuild,
+)
+from delivery.events import (
+    TRACKED_FIELDS,
+    record_changes,
+    record_initial_events,
+)
+from delivery.models import Delivery, bulk_changed
+
+
+# Значения до сохранения, нужные скетчам, журналу событий и подсказкам
+PREVIOUS_FIELDS = (
+    *SKETCH_FIELDS,
+    "updated_at",
+    "transport_number",
+    "collector",
+    *TRACKED_FIELDS.values(),
+)
+
+
+@receiver(pre_save, sender=Delivery)
+def remember_previous_values(sender, instance, raw, **kwargs):
+    instance._previous_values = (
+        Delivery.objects.filter(pk=instance.pk)
+        .values(*PREVIOUS_FIELDS)
+        .first()
+        if instance.pk and not raw
+        else None
+    )
+
+
+# Загрузка фикстур (raw) не обновляет ни скетчи, ни журнал событий:
+# после loaddata скетчи пересчитываются командой rebuild_transit_sketches
+@receiver(post_save, sender=Delivery)
+def update_transit_sketches(sender, instance, raw, **kwargs):
+    if raw:
+        return
+    days = {delivery_day(instance.delivery_datetime)}
+    previous = getattr(instance, "_previous_values", None)
+    if previous is not None:
+        if all(
+            previous[attname] == getattr(instance, attname)
+            for attname in SKETCH_FIELDS
+        ):
+            return
+        days.add(delivery_day(previous["delivery_datetime"]))
+    schedule_sketch_rebuild(days)
+
+
+@receiver(post_save, sender=Delivery)
+def record_delivery_events(sender, instance, created, raw, using, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, "_previous_values", None)
+    if created or previous is None:
+        record_initial_events([instance], using)
+        return
+    record_changes(
+        [
+            (
+                instance.pk,
+                previous,
+                {
+                    attname: getattr(instance, attname)
+                    for attname in TRACKED_FIELDS.values()
+                },
+            )
+        ],
+        using,
+    )
+
+
+@receiver(post_delete, sender=Delivery)
+def drop_from_transit_sketches(sender, instance, **kwargs):
+    schedule_sketch_rebuild({delivery_day(instance.delivery_datetime)})
+
+
+@receiver(bulk_changed, sender=Delivery)
+def update_transit_sketches_in_bulk(sender, days, fields, **kwargs):
+    if affects_sketches(fields):
+        schedule_sketch_rebuild(days)
@@ -0,0 +1,115 @@
+"""
+Компактный объединяемый t-digest для приблизительных квантилей.
+
+Используется для хранения посуточных распределений времени в пути:
+дайджесты за разные дни объединяются через ``merge`` без обращения
+к исходным строкам доставок.
+"""
+import math
+import struct
+
+DEFAULT_COMPRESSION = 100
+
+_HEADER = struct.Struct("<dd")
+_CENTROID = struct.Struct("<dd")
+
+
+class TDigest:
+    """Merging t-digest (Dunning) с масштабирующей функцией k1."""
+
+    def __init__(self, compression=DEFAULT_COMPRESSION):
+        self.compression = compression
+        self.centroids = []
+        self.min = math.inf
+        self.max = -math.inf
+
+    @property
+    def count(self):
+        return sum(weight for _, weight in self.centroids)
+
+    def _k(self, q):
+        return self.compression / (2 * math.pi) * math.asin(2 * q - 1)
+
+    def _k_inverse(self, k):
+        k = min(k, self.compression / 4)
+        return (math.sin(k * 2 * math.pi / self.compression) + 1) / 2
+
+    def _compress(self, centroids):
+        centroids.sort(key=lambda centroid: centroid[0])
+        total = sum(weight for _, weight in centroids)
+        result = []
+        so_far = 0.0
+        limit = total * self._k_inverse(self._k(0) + 1)
+        mean, weight = centroids[0]
+        for next_mean, next_weight in centroids[1:]:
+            if so_far + weight + next_weight <= limit:
+                weight += next_weight
+                mean += (next_mean - mean) * next_weight / weight
+            else:
+                result.append((mean, weight))
+                so_far += weight
+                limit = total * self._k_inverse(self._k(so_far / total) + 1)
+                mean, weight = next_mean, next_weight
+        result.append((mean, weight))
+        self.centroids = result
+
+    def update(self, values):
+        values = list(values)
+        if not values:
+            return self
+        self.min = min(self.min, min(values))
+        self.max = max(self.max, max(values))
+        self._compress(self.centroids + [(value, 1.0) for value in values])
+        return self
+
+    def merge(self, other):
+        if not other.centroids:
+            return self
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress(self.centroids + other.centroids)
+        return self
+
+    def quantile(self, q):
+        if not self.centroids:
+            return None
+        if len(self.centroids) == 1:
+            return self.centroids[0][0]
+        target = q * self.count
+        cumulative = 0.0
+        prev_center, prev_mean = 0.0, self.min
+        for mean, weight in self.centroids:
+            center = cumulative + weight / 2
+            if target < center:
+                span = center - prev_center
+                if span <= 0:
+                    return mean
+                return prev_mean + (mean - prev_mean) * (
+                    (target - prev_center) / span
+                )
+            cumulative += weight
+            prev_center, prev_mean = center, mean
+        span = cumulative - prev_center
+        if span <= 0:
+            return self.max
+        return prev_mean + (self.max - prev_mean) * (
+            (target - prev_center) / span
+        )
+
+    def to_bytes(self):
+        parts = [_HEADER.pack(self.min, self.max)]
+        parts.extend(
+            _CENTROID.pack(mean, weight) for mean, weight in self.centroids
+        )
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data, compression=DEFAULT_COMPRESSION):
+        digest = cls(compression)
+        data = bytes(data)
+        digest.min, digest.max = _HEADER.unpack_from(data)
+        digest.centroids = [
+            centroid
+            for centroid in _CENTROID.iter_unpack(data[_HEADER.size:])
+        ]
+        return digest
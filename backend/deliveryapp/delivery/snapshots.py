@@ -0,0 +1,231 @@
+"""
+Колоночные снимки доставок для офлайн-аналитики.
+
+Снимок — каталог с отдельным ``.npy``-файлом фиксированной ширины на каждую
+колонку и ``manifest.json`` со словарями названий справочников. Чтение идёт
+через ``numpy.load(mmap_mode="r")``: файлы отображаются в память, а фильтры
+и группировки выполняются векторно, без обращения к БД.
+"""
+import array
+import json
+import os
+import re
+import shutil
+from datetime import datetime, time, timezone as dt_timezone
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from api.models import (
+    TechStatus,
+    PackagingType,
+    Service,
+    DeliveryStatus,
+    TransportModel,
+)
+from delivery.models import Delivery
+
+MANIFEST = "manifest.json"
+LATEST = "LATEST"
+
+# Колонка -> (поле доставки, тип array.array, dtype NumPy).
+# Время хранится в секундах UNIX, пустые внешние ключи — как 0.
+COLUMNS = {
+    "id": ("id", "q", "<i8"),
+    "dispatch_datetime": ("dispatch_datetime", "q", "<i8"),
+    "delivery_datetime": ("delivery_datetime", "q", "<i8"),
+    "service": ("service_id", "q", "<i8"),
+    "packaging": ("packaging_id", "q", "<i8"),
+    "transport_model": ("transport_model_id", "q", "<i8"),
+    "status": ("status_id", "q", "<i8"),
+    "technical_condition": ("technical_condition_id", "q", "<i8"),
+    "distance": ("distance", "d", "<f8"),
+    "finished": ("finished", "B", "u1"),
+}
+
+# Справочники для словарного кодирования: колонка -> (модель, поле названия)
+DICTIONARIES = {
+    "service": (Service, "name"),
+    "packaging": (PackagingType, "name"),
+    "transport_model": (TransportModel, "number"),
+    "status": (DeliveryStatus, "name"),
+    "technical_condition": (TechStatus, "name"),
+}
+
+DISTANCE_RE = re.compile(r"\d+(?:[.,]\d+)?")
+
+
+def parse_distance(value):
+    """Число из строки вида «10 км»; ``nan``, если числа нет."""
+    match = DISTANCE_RE.search(value or "")
+    return float(match.group().replace(",", ".")) if match else float("nan")
+
+
+def _convert(column, value):
+    if column in ("dispatch_datetime", "delivery_datetime"):
+        return int(value.timestamp())
+    if column == "distance":
+        return parse_distance(value)
+    if column == "finished":
+        return int(value)
+    return value or 0
+
+
+def _default_root():
+    return Path(settings.SNAPSHOT_ROOT)
+
+
+def write_snapshot(root=None, chunk_size=5000):
+    """Записывает новый снимок и делает его последним. Возвращает путь."""
+    root = Path(root or _default_root())
+    root.mkdir(parents=True, exist_ok=True)
+    name = timezone.now().strftime("%Y%m%dT%H%M%S%f")
+    target = root / name
+    tmp = root / f".{name}.tmp"
+    tmp.mkdir()
+
+    buffers = {
+        column: array.array(typecode)
+        for column, (_, typecode, _) in COLUMNS.items()
+    }
+    fields = [field for field, _, _ in COLUMNS.values()]
+    rows = (
+        Delivery.objects.order_by("pk")
+        .values_list(*fields)
+        .iterator(chunk_size=chunk_size)
+    )
+    for row in rows:
+        for column, value in zip(COLUMNS, row):
+            buffers[column].append(_convert(column, value))
+
+    columns = {}
+    for column, (_, _, dtype) in COLUMNS.items():
+        filename = f"{column}.npy"
+        np.save(tmp / filename, np.frombuffer(buffers[column], dtype=dtype))
+        columns[column] = {"file": filename, "dtype": dtype}
+
+    manifest = {
+        "created_at": timezone.now().isoformat(),
+        "rows": len(buffers["id"]),
+        "columns": columns,
+        "dictionaries": {
+            column: {
+                str(pk): label
+                for pk, label in model.objects.values_list("pk", field)
+            }
+            for column, (model, field) in DICTIONARIES.items()
+        },
+    }
+    with open(tmp / MANIFEST, "w", encoding="utf-8") as file:
+        json.dump(manifest, file, ensure_ascii=False, indent=2)
+
+    os.rename(tmp, target)
+    latest_tmp = root / f".{LATEST}.tmp"
+    latest_tmp.write_text(name)
+    os.replace(latest_tmp, root / LATEST)
+    return target
+
+
+def prune_snapshots(root=None, keep=1):
+    """Удаляет все снимки, кроме ``keep`` последних (``keep`` >= 1)."""
+    if keep < 1:
+        raise ValueError("keep должен быть не меньше 1")
+    root = Path(root or _default_root())
+    snapshots = sorted(
+        path
+        for path in root.iterdir()
+        if path.is_dir() and not path.name.startswith(".")
+    )
+    for path in snapshots[:-keep]:
+        shutil.rmtree(path)
+
+
+def _day_bounds(day, end=False):
+    value = datetime.combine(day, time.max if end else time.min)
+    if settings.USE_TZ:
+        value = timezone.make_aware(value).astimezone(dt_timezone.utc)
+    return int(value.timestamp())
+
+
+class Snapshot:
+    """Снимок, отображённый в память."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path / MANIFEST, encoding="utf-8") as file:
+            self.manifest = json.load(file)
+        self.columns = {
+            column: np.load(self.path / meta["file"], mmap_mode="r")
+            for column, meta in self.manifest["columns"].items()
+        }
+        self.dictionaries = {
+            column: {int(pk): label for pk, label in labels.items()}
+            for column, labels in self.manifest["dictionaries"].items()
+        }
+
+    @classmethod
+    def latest(cls, root=None):
+        root = Path(root or _default_root())
+        return cls(root / (root / LATEST).read_text().strip())
+
+    def __len__(self):
+        return self.manifest["rows"]
+
+    def __getitem__(self, column):
+        return self.columns[column]
+
+    @property
+    def transit_seconds(self):
+        return self["delivery_datetime"] - self["dispatch_datetime"]
+
+    def filter(self, start_date=None, end_date=None, **values):
+        """
+        Булева маска строк. Период — по дню доставки включительно,
+        остальные аргументы — ID значений колонок
+        (``service=1``, ``status=[1, 2]``).
+        """
+        mask = np.ones(len(self), dtype=bool)
+        if start_date:
+            mask &= self["delivery_datetime"] >= _day_bounds(start_date)
+        if end_date:
+            mask &= self["delivery_datetime"] <= _day_bounds(end_date, True)
+        for column, value in values.items():
+            if isinstance(value, (list, tuple, set)):
+                mask &= np.isin(self[column], list(value))
+            else:
+                mask &= self[column] == value
+        return mask
+
+    def group_by(self, column, values=None, mask=None):
+        """
+        Группировка по колонке-справочнику: количество строк и, если
+        передан массив ``values``, его среднее по группе (без ``nan``).
+        """
+        keys = np.asarray(self[column])
+        if mask is not None:
+            keys = keys[mask]
+        counts = np.bincount(keys)
+        means = None
+        if values is not None:
+            values = np.asarray(values, dtype=float)
+            if mask is not None:
+                values = values[mask]
+            present = ~np.isnan(values)
+            sums = np.bincount(
+                keys[present], weights=values[present], minlength=len(counts)
+            )
+            totals = np.bincount(keys[present], minlength=len(counts))
+            with np.errstate(invalid="ignore", divide="ignore"):
+                means = sums / totals
+
+        labels = self.dictionaries.get(column, {})
+        result = {}
+        for key in np.flatnonzero(counts):
+            item = {"name": labels.get(int(key)), "count": int(counts[key])}
+            if means is not None:
+                mean = means[key]
+                item["mean"] = None if np.isnan(mean) else float(mean)
+            result[int(key)] = item
+        return result
@@ -0,0 +1,581 @@
+import os
+import random
+import tempfile
+from io import StringIO
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+
+from django.core.management import CommandError, call_command
+from django.db import transaction
+from django.db.models import Count
+from django.test import TestCase, override_settings
+
+from api.models import (
+    TechStatus,
+    PackagingType,
+    Service,
+    DeliveryStatus,
+    TransportModel,
+)
+from delivery.analytics import rebuild_transit_sketches, transit_percentiles
+from delivery.events import dwell_times
+from delivery.models import Delivery, DeliveryEvent, TransitTimeSketch
+from delivery.sketches import TDigest
+from delivery.snapshots import Snapshot, parse_distance, write_snapshot
+
+STATUS = DeliveryEvent.FIELD_STATUS
+
+
+class DeliveryTestMixin:
+    @classmethod
+    def setUpTestData(cls):
+        cls.transport_model = TransportModel.objects.create(number="ABC-1")
+        cls.service = Service.objects.create(name="Доставка")
+        cls.packaging = PackagingType.objects.create(name="Ящик")
+        cls.statuses = [
+            DeliveryStatus.objects.create(name=name)
+            for name in ("Ожидает", "В пути", "Доставлено")
+        ]
+        cls.tech_status = TechStatus.objects.create(name="Новый")
+
+    def make_delivery(self, **kwargs):
+        dispatch = kwargs.pop(
+            "dispatch_datetime",
+            datetime(2025, 5, 10, 9, tzinfo=dt_timezone.utc),
+        )
+        fields = {
+            "transport_model": self.transport_model,
+            "transport_number": "ABC-1",
+            "dispatch_datetime": dispatch,
+            "delivery_datetime": dispatch + timedelta(hours=2),
+            "distance": "10 км",
+            "service": self.service,
+            "packaging": self.packaging,
+            "status": self.statuses[0],
+            "technical_condition": self.tech_status,
+        }
+        fields.update(kwargs)
+        return Delivery(**fields)
+
+
+def exact_quantile(values, q):
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+class TDigestTests(TestCase):
+    def setUp(self):
+        rng = random.Random(42)
+        self.values = [rng.lognormvariate(8, 1) for _ in range(20000)]
+
+    def assertQuantilesClose(self, digest, values):
+        ordered = sorted(values)
+        for q in (0.01, 0.1, 0.5, 0.9, 0.99):
+            # Погрешность оценивается по рангу: значение дайджеста должно
+            # лежать между точными квантилями соседних рангов
+            estimate = digest.quantile(q)
+            low = exact_quantile(ordered, max(q - 0.01, 0))
+            high = exact_quantile(ordered, min(q + 0.01, 1))
+            self.assertTrue(low <= estimate <= high, (q, low, estimate, high))
+
+    def test_quantiles_match_exact(self):
+        digest = TDigest().update(self.values)
+
+        self.assertEqual(digest.count, len(self.values))
+        self.assertLess(len(digest.centroids), 200)
+        self.assertQuantilesClose(digest, self.values)
+
+    def test_merge_of_several_digests(self):
+        chunks = [self.values[i::7] for i in range(7)]
+        digest = TDigest()
+        for chunk in chunks:
+            digest.merge(TDigest().update(chunk))
+
+        self.assertEqual(digest.count, len(self.values))
+        self.assertEqual(digest.min, min(self.values))
+        self.assertEqual(digest.max, max(self.values))
+        self.assertQuantilesClose(digest, self.values)
+
+    def test_bytes_round_trip(self):
+        digest = TDigest().update(self.values)
+        restored = TDigest.from_bytes(memoryview(digest.to_bytes()))
+
+        self.assertEqual(restored.centroids, digest.centroids)
+        self.assertEqual(restored.min, digest.min)
+        self.assertEqual(restored.max, digest.max)
+        self.assertEqual(restored.quantile(0.9), digest.quantile(0.9))
+
+    def test_empty_and_single_value(self):
+        empty = TDigest()
+        self.assertIsNone(empty.quantile(0.5))
+        self.assertEqual(empty.count, 0)
+        self.assertIsNone(TDigest.from_bytes(empty.to_bytes()).quantile(0.5))
+        self.assertIs(TDigest().merge(empty).update([]).quantile(0.5), None)
+
+        single = TDigest().update([42.0])
+        for q in (0, 0.5, 1):
+            self.assertEqual(single.quantile(q), 42.0)
+        self.assertEqual(
+            TDigest.from_bytes(single.to_bytes()).quantile(0.99), 42.0
+        )
+
+
+class TransitSketchTests(DeliveryTestMixin, TestCase):
+    def median(self):
+        return transit_percentiles(TransitTimeSketch.DIMENSION_ALL, [0.5])
+
+    def test_bulk_paths_rebuild_sketches(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            deliveries = Delivery.objects.bulk_create(
+                [self.make_delivery(), self.make_delivery()]
+            )
+        self.assertEqual(self.median()[0]["count"], 2)
+        self.assertEqual(self.median()[0]["quantiles"][0.5], 2 * 3600)
+
+        # Перенос на другой день пересчитывает и старый, и новый день
+        for delivery in deliveries:
+            delivery.delivery_datetime += timedelta(days=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            Delivery.objects.bulk_update(deliveries, ["delivery_datetime"])
+        days = TransitTimeSketch.objects.values_list("day", flat=True)
+        self.assertEqual(
+            set(days), {deliveries[0].delivery_datetime.date()}
+        )
+        self.assertEqual(self.median()[0]["quantiles"][0.5], 26 * 3600)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Delivery.objects.filter(pk=deliveries[0].pk).update(
+                dispatch_datetime=deliveries[0].delivery_datetime
+                - timedelta(hours=1)
+            )
+        self.assertEqual(
+            sorted(
+                TDigest.from_bytes(digest).min
+                for digest in TransitTimeSketch.objects.filter(
+                    dimension=TransitTimeSketch.DIMENSION_ALL
+                ).values_list("digest", flat=True)
+            ),
+            [3600],
+        )
+
+    def test_unrelated_changes_skip_rebuild(self):
+        delivery = self.make_delivery()
+        with self.captureOnCommitCallbacks(execute=True):
+            delivery.save()
+        TransitTimeSketch.objects.all().delete()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            delivery.comment = "Без изменения времени в пути"
+            delivery.save()
+            Delivery.objects.filter(pk=delivery.pk).update(comment="Хрупкое")
+            Delivery.objects.bulk_update([delivery], ["collector"])
+        self.assertFalse(TransitTimeSketch.objects.exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            delivery.packaging = None
+            delivery.save()
+        self.assertEqual(
+            set(
+                TransitTimeSketch.objects.values_list(
+                    "dimension", "dimension_id"
+                )
+            ),
+            {
+                (TransitTimeSketch.DIMENSION_ALL, 0),
+                (TransitTimeSketch.DIMENSION_SERVICE, self.service.pk),
+                (TransitTimeSketch.DIMENSION_PACKAGING, 0),
+                (
+                    TransitTimeSketch.DIMENSION_TRANSPORT_MODEL,
+                    self.transport_model.pk,
+                ),
+            },
+        )
+
+    def test_rebuild_upserts_and_drops_stale_values(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            delivery = Delivery.objects.bulk_create([self.make_delivery()])[0]
+        day = delivery.delivery_datetime.date()
+        rebuild_transit_sketches([day])
+        ids = dict(
+            TransitTimeSketch.objects.values_list("dimension", "pk")
+        )
+
+        other = Service.objects.create(name="Экспресс")
+        with self.captureOnCommitCallbacks(execute=True):
+            Delivery.objects.filter(pk=delivery.pk).update(service=other)
+
+        services = TransitTimeSketch.objects.filter(
+            dimension=TransitTimeSketch.DIMENSION_SERVICE
+        ).values_list("dimension_id", flat=True)
+        self.assertEqual(list(services), [other.pk])
+        # Строки неизменившихся значений обновляются на месте
+        self.assertEqual(
+            TransitTimeSketch.objects.get(
+                dimension=TransitTimeSketch.DIMENSION_ALL
+            ).pk,
+            ids[TransitTimeSketch.DIMENSION_ALL],
+        )
+
+    def test_raw_save_is_skipped(self):
+        delivery = self.make_delivery()
+        # При загрузке фикстур auto_now-поля не заполняются
+        delivery.created_at = delivery.updated_at = delivery.dispatch_datetime
+        with self.captureOnCommitCallbacks(execute=True):
+            delivery.save_base(raw=True)
+
+        self.assertFalse(TransitTimeSketch.objects.exists())
+        self.assertFalse(
+            DeliveryEvent.objects.filter(delivery_id=delivery.pk).exists()
+        )
+
+
+class DeliveryEventTests(DeliveryTestMixin, TestCase):
+    def status_events(self, delivery):
+        return list(
+            DeliveryEvent.objects.filter(
+                delivery_id=delivery.pk, field=STATUS
+            )
+            .order_by("pk")
+            .values_list("value", flat=True)
+        )
+
+    def test_commit_writes_batch(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            delivery = self.make_delivery()
+            delivery.save()
+            delivery.status = self.statuses[1]
+            delivery.save()
+            delivery.comment = "без изменения статуса"
+            delivery.save()
+
+        self.assertEqual(
+            self.status_events(delivery),
+            [self.statuses[0].pk, self.statuses[1].pk],
+        )
+
+    def test_rollback_discards_events(self):
+        delivery = self.make_delivery()
+        with self.captureOnCommitCallbacks(execute=True):
+            delivery.save()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    delivery.status = self.statuses[2]
+                    delivery.save()
+                    raise ValueError
+            except ValueError:
+                pass
+
+        self.assertEqual(self.status_events(delivery), [self.statuses[0].pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            delivery.status = self.statuses[1]
+            delivery.save()
+
+        self.assertEqual(
+            self.status_events(delivery),
+            [self.statuses[0].pk, self.statuses[1].pk],
+        )
+
+    def test_one_batch_per_savepoint(self):
+        delivery = self.make_delivery()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            delivery.save()
+            delivery.status = self.statuses[1]
+            delivery.save()
+            with transaction.atomic():
+                delivery.status = self.statuses[2]
+                delivery.save()
+
+        flushes = [c for c in callbacks if c.__qualname__ == "_Batch.flush"]
+        self.assertEqual(len(flushes), 2)
+        self.assertEqual(
+            self.status_events(delivery),
+            [s.pk for s in self.statuses[:3]],
+        )
+
+    def test_savepoint_rollback_discards_only_inner_events(self):
+        delivery = self.make_delivery()
+        with self.captureOnCommitCallbacks(execute=True):
+            delivery.save()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                delivery.finished = True
+                delivery.save()
+                try:
+                    with transaction.atomic():
+                        delivery.status = self.statuses[2]
+                        delivery.save()
+                        raise ValueError
+                except ValueError:
+                    delivery.status = self.statuses[0]
+                delivery.technical_condition = TechStatus.objects.create(
+                    name="Требует ремонта"
+                )
+                delivery.save()
+
+        self.assertEqual(self.status_events(delivery), [self.statuses[0].pk])
+        self.assertEqual(
+            set(
+                DeliveryEvent.objects.filter(delivery_id=delivery.pk)
+                .exclude(field=STATUS)
+                .values_list("field", flat=True)
+            ),
+            {
+                DeliveryEvent.FIELD_FINISHED,
+                DeliveryEvent.FIELD_TECHNICAL_CONDITION,
+            },
+        )
+
+    def test_bulk_create_records_initial_values(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            deliveries = Delivery.objects.bulk_create(
+                [self.make_delivery(), self.make_delivery()]
+            )
+
+        for delivery in deliveries:
+            self.assertEqual(
+                self.status_events(delivery), [self.statuses[0].pk]
+            )
+            self.assertEqual(
+                DeliveryEvent.objects.filter(delivery_id=delivery.pk).count(),
+                len(DeliveryEvent.FIELD_CHOICES),
+            )
+
+    def test_queryset_update_records_changed_rows(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first, second = Delivery.objects.bulk_create(
+                [
+                    self.make_delivery(),
+                    self.make_delivery(status=self.statuses[1]),
+                ]
+            )
+        with self.captureOnCommitCallbacks(execute=True):
+            Delivery.objects.filter(pk__in=[first.pk, second.pk]).update(
+                status=self.statuses[1]
+            )
+
+        self.assertEqual(
+            self.status_events(first),
+            [self.statuses[0].pk, self.statuses[1].pk],
+        )
+        self.assertEqual(self.status_events(second), [self.statuses[1].pk])
+
+    def test_bulk_update_records_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            deliveries = Delivery.objects.bulk_create(
+                [self.make_delivery(), self.make_delivery()]
+            )
+        deliveries[0].status = self.statuses[2]
+        with self.captureOnCommitCallbacks(execute=True):
+            Delivery.objects.bulk_update(deliveries, ["status", "comment"])
+
+        self.assertEqual(
+            self.status_events(deliveries[0]),
+            [self.statuses[0].pk, self.statuses[2].pk],
+        )
+        self.assertEqual(
+            self.status_events(deliveries[1]), [self.statuses[0].pk]
+        )
+
+    def test_dwell_times_over_period(self):
+        delivery = self.make_delivery()
+        with self.captureOnCommitCallbacks(execute=True):
+            delivery.save()
+        start = datetime(2025, 5, 1, tzinfo=dt_timezone.utc)
+        DeliveryEvent.objects.filter(delivery_id=delivery.pk).delete()
+        DeliveryEvent.objects.bulk_create(
+            DeliveryEvent(
+                delivery_id=delivery.pk,
+                field=STATUS,
+                value=status.pk,
+                created_at=start + timedelta(hours=hours),
+            )
+            for status, hours in (
+                (self.statuses[0], 0),
+                (self.statuses[1], 2),
+                (self.statuses[2], 5),
+            )
+        )
+
+        stats = dwell_times(
+            STATUS,
+            start=start + timedelta(hours=1),
+            end=start + timedelta(hours=4),
+        )
+
+        # Интервал «Ожидает» начался до периода, «Доставлено» — после
+        self.assertEqual(list(stats), [self.statuses[1].pk])
+        self.assertEqual(stats[self.statuses[1].pk]["entries"], 1)
+        self.assertEqual(stats[self.statuses[1].pk]["open"], 0)
+        self.assertEqual(
+            stats[self.statuses[1].pk]["total_seconds"], 3 * 3600
+        )
+
+        stats = dwell_times(STATUS, start=start)
+        self.assertEqual(stats[self.statuses[0].pk]["avg_seconds"], 2 * 3600)
+        self.assertEqual(stats[self.statuses[2].pk]["open"], 1)
+
+
+class SnapshotCommandTests(DeliveryTestMixin, TestCase):
+    def test_keep_prunes_old_snapshots(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.make_delivery().save()
+        with tempfile.TemporaryDirectory() as root:
+            for _ in range(3):
+                call_command(
+                    "export_delivery_snapshot",
+                    output=root,
+                    keep=2,
+                    stdout=StringIO(),
+                )
+
+            self.assertEqual(len(Snapshot.latest(root)), 1)
+            self.assertEqual(
+                sum(entry.is_dir() for entry in os.scandir(root)), 2
+            )
+
+    def test_keep_must_be_positive(self):
+        with tempfile.TemporaryDirectory() as root:
+            with self.assertRaises(CommandError):
+                call_command("export_delivery_snapshot", output=root, keep=0)
+            self.assertEqual(os.listdir(root), [])
+
+
+@override_settings(TIME_ZONE="Europe/Moscow")
+class SnapshotTests(DeliveryTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other_service = Service.objects.create(name="Экспресс")
+        start = datetime(2025, 5, 10, 9, tzinfo=dt_timezone.utc)
+        distances = ["10 км", "2,5 км", "около 7.5", "неизвестно"]
+        deliveries = []
+        for i in range(24):
+            dispatch = start + timedelta(hours=7 * i)
+            deliveries.append(
+                Delivery(
+                    transport_model=cls.transport_model,
+                    transport_number=f"ABC-{i}",
+                    dispatch_datetime=dispatch,
+                    # Часть доставок приходится на ночь, когда дни
+                    # по Москве и по UTC расходятся
+                    delivery_datetime=dispatch + timedelta(
+                        hours=13, minutes=30
+                    ),
+                    distance=distances[i % len(distances)],
+                    service=(cls.service, cls.other_service)[i % 2],
+                    packaging=cls.packaging if i % 3 else None,
+                    status=cls.statuses[i % 3],
+                    technical_condition=cls.tech_status,
+                )
+            )
+        Delivery.objects.bulk_create(deliveries)
+
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.snapshot = Snapshot(write_snapshot(root.name))
+
+    def orm_counts(self, column, deliveries):
+        return {
+            key or 0: count
+            for key, count in deliveries.order_by()
+            .values_list(column)
+            .annotate(count=Count("pk"))
+        }
+
+    def snapshot_counts(self, column, mask):
+        return {
+            key: item["count"]
+            for key, item in self.snapshot.group_by(column, mask=mask).items()
+        }
+
+    def test_group_by_matches_orm(self):
+        start, end = date(2025, 5, 11), date(2025, 5, 13)
+        statuses = [self.statuses[0].pk, self.statuses[2].pk]
+        cases = [
+            ({}, Delivery.objects.all()),
+            (
+                {"start_date": start, "end_date": end},
+                Delivery.objects.filter(
+                    delivery_datetime__date__range=(start, end)
+                ),
+            ),
+            (
+                {"start_date": start, "service": self.other_service.pk},
+                Delivery.objects.filter(
+                    delivery_datetime__date__gte=start,
+                    service=self.other_service,
+                ),
+            ),
+            (
+                {"end_date": end, "status": statuses},
+                Delivery.objects.filter(
+                    delivery_datetime__date__lte=end, status__in=statuses
+                ),
+            ),
+        ]
+        for filters, deliveries in cases:
+            mask = self.snapshot.filter(**filters)
+            self.assertEqual(int(mask.sum()), deliveries.count(), filters)
+            for column in ("service", "packaging", "status"):
+                with self.subTest(filters=filters, column=column):
+                    self.assertEqual(
+                        self.snapshot_counts(column, mask),
+                        self.orm_counts(column, deliveries),
+                    )
+
+    def test_group_by_mean_skips_nan(self):
+        mask = self.snapshot.filter(service=self.service.pk)
+        groups = self.snapshot.group_by(
+            "status", values=self.snapshot["distance"], mask=mask
+        )
+        expected = {}
+        for status_id, distance in Delivery.objects.filter(
+            service=self.service
+        ).values_list("status_id", "distance"):
+            expected.setdefault(status_id, []).append(parse_distance(distance))
+        self.assertEqual(groups.keys(), expected.keys())
+        for status_id, values in expected.items():
+            known = [value for value in values if value == value]
+            mean = groups[status_id]["mean"]
+            if known:
+                self.assertAlmostEqual(mean, sum(known) / len(known))
+            else:
+                self.assertIsNone(mean)
+
+        # Группа, где у всех доставок дистанция без числа
+        nan_status = DeliveryStatus.objects.create(name="Потеряно")
+        Delivery.objects.filter(distance="неизвестно").update(
+            status=nan_status
+        )
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        snapshot = Snapshot(write_snapshot(root.name))
+        groups = snapshot.group_by("status", values=snapshot["distance"])
+        self.assertEqual(groups[nan_status.pk]["count"], 6)
+        self.assertIsNone(groups[nan_status.pk]["mean"])
+        self.assertEqual(groups[nan_status.pk]["name"], "Потеряно")
+
+    def test_manifest_dictionaries(self):
+        self.assertEqual(len(self.snapshot), Delivery.objects.count())
+        self.assertEqual(
+            self.snapshot.dictionaries["service"],
+            dict(Service.objects.values_list("pk", "name")),
+        )
+        self.assertEqual(
+            self.snapshot.dictionaries["transport_model"],
+            dict(TransportModel.objects.values_list("pk", "number")),
+        )
+        groups = self.snapshot.group_by("service")
+        self.assertEqual(
+            {key: item["name"] for key, item in groups.items()},
+            {
+                self.service.pk: self.service.name,
+                self.other_service.pk: self.other_service.name,
+            },
+        )
+        # Пустой внешний ключ хранится как 0 и не имеет названия
+        self.assertIsNone(self.snapshot.group_by("packaging")[0]["name"])
@@ -3,6 +3,9 @@ ASGI config for deliveryapp project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Поток событий ``/api/deliveries/stream/`` обслуживается отдельным
+легковесным ASGI-приложением в обход стека middleware Django.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -13,4 +16,14 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'deliveryapp.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from api.streaming import sse_application  # noqa: E402
+
+STREAM_PATH = "/api/deliveries/stream/"
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "http" and scope["path"] == STREAM_PATH:
+        return await sse_application(scope, receive, send)
+    return await django_application(scope, receive, send)
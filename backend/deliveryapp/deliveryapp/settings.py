@@ -37,6 +37,8 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    # OpClass в функциональных индексах подсказок
+    "django.contrib.postgres",
     "corsheaders",
     "rest_framework",
     "djoser",
@@ -100,6 +102,31 @@ else:
     }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# locmem — отдельный кэш в каждом процессе: изменение, сделанное через один
+# воркер, не сбрасывает ответы, закэшированные другими. При нескольких
+# воркерах нужен общий бэкенд (CACHE_TYPE=file)
+CACHE_TYPE = os.getenv("CACHE_TYPE", "locmem")
+
+if CACHE_TYPE == "file":
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": os.getenv("CACHE_LOCATION", BASE_DIR / "cache"),
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+# Время жизни закэшированных ответов API (секунды)
+RESPONSE_CACHE_TIMEOUT = int(os.getenv("RESPONSE_CACHE_TIMEOUT", 300))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -153,6 +180,12 @@ STATIC_ROOT = BASE_DIR / "static"
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# Колоночные снимки доставок (manage.py export_delivery_snapshot)
+SNAPSHOT_ROOT = os.getenv("SNAPSHOT_ROOT", BASE_DIR / "snapshots")
+
+# Внутренний (internal) location nginx, отдающий MEDIA_ROOT по X-Accel-Redirect
+ACCEL_REDIRECT_PREFIX = "/protected-media/"
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
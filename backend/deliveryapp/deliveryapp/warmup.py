@@ -0,0 +1,94 @@
+"""
+Прогрев приложения перед обработкой первых запросов.
+
+При ``preload_app`` gunicorn вызывает ``warmup`` в мастер-процессе до
+форка: скомпилированный резолвер URL, кэши ``Model._meta`` и ответы
+справочников достаются воркерам через copy-on-write, и первый запрос
+в каждом воркере не платит за их построение.
+
+Ответы справочников кэшируются без учёта пользователя
+(``ReferenceViewSet.cache_per_user``), поэтому заполненные здесь записи
+находятся и для анонимных, и для авторизованных запросов.
+
+Ошибка БД (она ещё не поднята или не мигрирована) не должна ронять
+мастер, поэтому наполнение кэша справочников при ней пропускается;
+резолвер и метаданные моделей от БД не зависят и прогреваются всегда.
+"""
+import gc
+import logging
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.test import RequestFactory
+from django.urls import resolve, reverse
+from rest_framework import serializers as drf_serializers
+
+# Справочники, ответы на которые кладутся в кэш при прогреве
+REFERENCE_ROUTES = (
+    "tech-status-list",
+    "packaging-types-list",
+    "services-list",
+    "delivery-statuses-list",
+    "transport-models-list",
+)
+
+logger = logging.getLogger(__name__)
+
+
+def compile_urls():
+    """Строит резолвер URL, включая маршруты роутера ``api/urls.py``."""
+    from api.urls import router
+
+    for pattern in router.urls:
+        if pattern.name and pattern.name.endswith("-list"):
+            resolve(reverse(pattern.name))
+
+
+def build_serializers():
+    """
+    Один раз строит поля всех сериализаторов API. Сами экземпляры
+    выбрасываются; остаются заполненные кэши ``Model._meta`` (списки
+    полей и обратных связей), которые DRF обходит при построении полей.
+    """
+    from api import serializers
+
+    for value in vars(serializers).values():
+        if (
+            isinstance(value, type)
+            and issubclass(value, drf_serializers.ModelSerializer)
+            and value.__module__ == serializers.__name__
+        ):
+            value().fields
+
+
+def prime_reference_data():
+    """Выполняет GET по спискам справочников, заполняя кэш ответов."""
+    factory = RequestFactory(HTTP_HOST=settings.ALLOWED_HOSTS[0])
+    for name in REFERENCE_ROUTES:
+        path = reverse(name)
+        try:
+            response = resolve(path).func(factory.get(path))
+        except DatabaseError:
+            logger.warning(
+                "Прогрев справочников пропущен: БД недоступна",
+                exc_info=True,
+            )
+            return
+        response.render()
+
+
+def warmup():
+    compile_urls()
+    build_serializers()
+    prime_reference_data()
+    # Соединения с БД нельзя разделять между процессами после форка
+    connections.close_all()
+
+
+def freeze():
+    """
+    Переносит созданные объекты в постоянное поколение сборщика мусора,
+    чтобы его проходы в воркерах не копировали разделяемые страницы.
+    """
+    gc.collect()
+    gc.freeze()
@@ -0,0 +1,32 @@
+"""
+Настройки gunicorn (подхватываются автоматически из рабочего каталога).
+
+По умолчанию приложение загружается и прогревается в мастер-процессе
+до форка воркеров (``GUNICORN_PRELOAD=False`` отключает это).
+"""
+import os
+
+bind = "0:8000"
+worker_class = "uvicorn_worker.UvicornWorker"
+workers = int(os.getenv("GUNICORN_WORKERS", 1))
+preload_app = os.getenv("GUNICORN_PRELOAD", "True") == "True"
+
+loglevel = "debug"
+accesslog = "-"
+errorlog = "-"
+
+
+def when_ready(server):
+    # С preload_app приложение уже импортировано, воркеры ещё не созданы
+    if preload_app:
+        from deliveryapp.warmup import freeze, warmup
+
+        warmup()
+        freeze()
+
+
+def post_worker_init(worker):
+    if not preload_app:
+        from deliveryapp.warmup import warmup
+
+        warmup()
@@ -0,0 +1,169 @@
+"""
+Замер запуска воркеров с прогревом в мастере и без него.
+
+Повторяет схему gunicorn с ASGI-приложением ``deliveryapp.asgi``: в режиме
+``cold`` каждый форкнутый воркер сам импортирует и прогревает приложение
+(как ``post_worker_init``), в режиме ``preload`` это делается один раз
+до форка (как ``when_ready``). Для каждого воркера печатаются время
+импорта и прогрева, задержки первого и второго запросов и объём
+собственной (не разделяемой) памяти.
+
+Перед каждым запросом кэш ответов очищается, чтобы замер не зависел
+от того, закэшировал ли ответ прогрев или соседний воркер.
+
+    python measure_startup.py --workers 4 --path /api/deliveries/
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "deliveryapp.settings")
+
+
+def load_application():
+    from deliveryapp.asgi import application
+    from deliveryapp.warmup import warmup
+
+    warmup()
+    return application
+
+
+async def _call(application, scope):
+    messages = [{"type": "http.request", "body": b"", "more_body": False}]
+    finished = asyncio.Event()
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        # Клиент «отключается» только после получения всего ответа
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.body" and not message.get(
+            "more_body"
+        ):
+            finished.set()
+
+    await application(scope, receive, send)
+
+
+def request(application, path):
+    from django.conf import settings
+    from django.core.cache import cache
+
+    host = settings.ALLOWED_HOSTS[0]
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "headers": [(b"host", host.encode())],
+        "server": (host, 80),
+        "client": ("127.0.0.1", 0),
+    }
+    cache.clear()
+    loop = asyncio.new_event_loop()
+    try:
+        started = time.perf_counter()
+        loop.run_until_complete(_call(application, scope))
+        return (time.perf_counter() - started) * 1000
+    finally:
+        loop.close()
+
+
+def private_memory_mb():
+    try:
+        with open("/proc/self/smaps_rollup") as file:
+            fields = dict(
+                line.split(":", 1) for line in file if ":" in line
+            )
+    except OSError:
+        return None
+    private = sum(
+        int(fields[name].split()[0])
+        for name in ("Private_Clean", "Private_Dirty")
+        if name in fields
+    )
+    return round(private / 1024, 1)
+
+
+def worker(application, path, pipe):
+    load_ms = 0.0
+    if application is None:
+        started = time.perf_counter()
+        application = load_application()
+        load_ms = (time.perf_counter() - started) * 1000
+    result = {
+        "pid": os.getpid(),
+        "load_ms": round(load_ms, 1),
+        "first_request_ms": round(request(application, path), 1),
+        "second_request_ms": round(request(application, path), 1),
+        "private_mb": private_memory_mb(),
+    }
+    os.write(pipe, json.dumps(result).encode())
+    os._exit(0)
+
+
+def run(mode, workers, path):
+    application = None
+    master_ms = 0.0
+    if mode == "preload":
+        started = time.perf_counter()
+        application = load_application()
+        from deliveryapp.warmup import freeze
+
+        freeze()
+        master_ms = (time.perf_counter() - started) * 1000
+
+    results = []
+    for _ in range(workers):
+        read, write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read)
+            worker(application, path, write)
+        os.close(write)
+        with os.fdopen(read) as pipe:
+            results.append(json.loads(pipe.read()))
+        os.waitpid(pid, 0)
+    return master_ms, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--path", default="/api/deliveries/")
+    parser.add_argument(
+        "--mode", choices=("cold", "preload"), action="append"
+    )
+    args = parser.parse_args()
+
+    for mode in args.mode or ("cold", "preload"):
+        # Каждый режим — в отдельном процессе, чтобы импорты не смешивались
+        pid = os.fork()
+        if pid:
+            os.waitpid(pid, 0)
+            continue
+        master_ms, results = run(mode, args.workers, args.path)
+        print(f"[{mode}] импорт и прогрев в мастере: {master_ms:.1f} мс")
+        for item in results:
+            print(
+                f"  pid {item['pid']}: импорт и прогрев {item['load_ms']} мс, "
+                f"первый запрос {item['first_request_ms']} мс, "
+                f"второй {item['second_request_ms']} мс, "
+                f"собственная память {item['private_mb']} МБ"
+            )
+        sys.stdout.flush()
+        os._exit(0)
+
+
+if __name__ == "__main__":
+    main()